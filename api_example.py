@@ -8,18 +8,81 @@ Este es un ejemplo simple de cómo crear una API que:
 4. Proporciona webhooks para recibir resultados de n8n
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context, url_for
 import json
+import multiprocessing
+import os
+import time
+import msgpack
+from pydantic import ValidationError
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from glovo_business_logic import GlovoImageProcessor
+from glovo_business_logic import GlovoImageProcessor, JobCompletionQueue
+from orjson_provider import OrjsonProvider
+from schemas import (
+    ClaimJobsRequest, JobCompleteRequest, PaymentRequest, ProcessRestaurantRequest, StartJobRequest
+)
 
 app = Flask(__name__)
-processor = GlovoImageProcessor()
+app.json = OrjsonProvider(app)
 
-# Simulación de datos de usuario (en producción usar una BD real)
-USERS = {
-    "test@example.com": {"credits": 100, "premium": False}
-}
+# Parseo del HTML en procesos aparte (opcional): BeautifulSoup es CPU-bound y
+# bloquea el GIL del worker. Se usa 'spawn' para no heredar el estado de gevent.
+_parse_processes = int(os.getenv('SCRAPE_PARSE_PROCESSES', '0'))
+parse_pool = ProcessPoolExecutor(
+    max_workers=_parse_processes,
+    mp_context=multiprocessing.get_context('spawn')
+) if _parse_processes > 0 else None
+
+processor = GlovoImageProcessor(parse_executor=parse_pool)
+
+# Las finalizaciones de n8n se persisten en segundo plano
+completion_queue = JobCompletionQueue(
+    processor,
+    maxsize=int(os.getenv('COMPLETION_QUEUE_SIZE', '1000')),
+    workers=int(os.getenv('COMPLETION_WORKERS', '16'))
+)
+
+# Por encima de este número de scrapings pendientes se rechazan solicitudes nuevas
+SCRAPE_BACKLOG_HIGH_WATER = int(os.getenv('SCRAPE_BACKLOG_HIGH_WATER', '100'))
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Errores de msgpack.unpackb con un body mal formado (p.ej. bytes sobrantes: ExtraData)
+MSGPACK_ERRORS = (msgpack.exceptions.UnpackException, msgpack.exceptions.ExtraData, ValueError)
+
+def _n8n_payload() -> dict:
+    """Body de una llamada de n8n, en JSON o MessagePack según Content-Type
+    
+    Lanza alguno de ``MSGPACK_ERRORS`` si el MessagePack no se puede decodificar.
+    """
+    if request.mimetype == MSGPACK_MIMETYPE:
+        return msgpack.unpackb(request.get_data(), raw=False) or {}
+    return request.get_json(silent=True) or {}
+
+def _validation_error(e: ValidationError):
+    """Respuesta 422 con los errores de validación del body"""
+    return jsonify({
+        "error": "Datos de entrada inválidos",
+        "details": e.errors(include_url=False, include_context=False, include_input=False)
+    }), 422
+
+def _undecodable_body(e: Exception):
+    """Respuesta 400 (mismo formato que _validation_error) si el body no se puede decodificar"""
+    return jsonify({
+        "error": "Datos de entrada inválidos",
+        "details": [{"type": "msgpack_decode", "msg": str(e) or type(e).__name__}]
+    }), 400
+
+def _wants_msgpack() -> bool:
+    """True si el cliente prefiere MessagePack según su cabecera Accept"""
+    return request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+def _n8n_response(payload: dict, status: int = 200):
+    """Responde en MessagePack si el cliente lo pide en Accept, si no en JSON"""
+    if _wants_msgpack():
+        return Response(msgpack.packb(payload, default=str), status=status, mimetype=MSGPACK_MIMETYPE)
+    return jsonify(payload), status
 
 @app.route('/api/process-restaurant', methods=['POST'])
 def process_restaurant():
@@ -32,24 +95,26 @@ def process_restaurant():
     }
     """
     try:
-        data = request.get_json()
-        restaurant_url = data.get('restaurant_url')
-        user_email = data.get('user_email')
-        
-        if not restaurant_url or not user_email:
-            return jsonify({"error": "Faltan parámetros requeridos"}), 400
+        body = ProcessRestaurantRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error(e)
+    
+    try:
+        restaurant_url, user_email = body.restaurant_url, body.user_email
         
-        # Validar URL de Glovo
-        if 'glovoapp.com' not in restaurant_url:
-            return jsonify({"error": "URL de restaurante inválida"}), 400
+        # Mejor un 503 visible que latencias crecientes con el pool saturado
+        if processor.scrape_backlog >= SCRAPE_BACKLOG_HIGH_WATER:
+            return jsonify({"error": "Sistema saturado, reintentar más tarde"}), 503, {'Retry-After': '30'}
         
-        # Procesar solicitud
-        result = processor.process_restaurant_request(restaurant_url, user_email)
+        # El scraping y la creación de trabajos se hacen en segundo plano;
+        # el progreso se consulta en la URL de la cabecera Location
+        request_id = processor.submit_restaurant_request(restaurant_url, user_email)
         
-        if "error" in result:
-            return jsonify(result), 400
-        
-        return jsonify(result), 200
+        return jsonify({
+            "success": True,
+            "request_id": request_id,
+            "status": "queued"
+        }), 202, {'Location': url_for('get_request_status', request_id=request_id)}
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -58,6 +123,9 @@ def process_restaurant():
 def get_request_status(request_id):
     """
     Obtiene el estado de una solicitud de procesamiento
+    
+    Devuelve un ETag; si el cliente envía el mismo en If-None-Match se
+    responde 304 sin volver a serializar el estado.
     """
     try:
         status = processor.get_request_status(request_id)
@@ -65,11 +133,40 @@ def get_request_status(request_id):
         if "error" in status:
             return jsonify(status), 404
         
-        return jsonify(status), 200
+        etag = processor.request_status_etag(status)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify(status)
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/events/<request_id>', methods=['GET'])
+def request_events(request_id):
+    """
+    Server-Sent Events con el estado de una solicitud
+    
+    Emite un evento cada vez que el estado cambia y cierra el stream
+    cuando la solicitud termina (o falla).
+    """
+    def stream():
+        for status in processor.watch_request_status(request_id):
+            if status is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {app.json.dumps(status)}\n\n"
+    
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/n8n/pending-jobs', methods=['GET'])
 def get_pending_jobs():
     """
@@ -82,11 +179,40 @@ def get_pending_jobs():
         limit = int(request.args.get('limit', 10))
         jobs = processor.get_pending_jobs_for_n8n(limit)
         
-        return jsonify({
+        return _n8n_response({
             "success": True,
             "total_jobs": len(jobs),
             "jobs": jobs
-        }), 200
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/n8n/claim-jobs', methods=['POST'])
+def claim_jobs():
+    """
+    Reclama trabajos pendientes y los marca como iniciados en una sola llamada
+    
+    Body: {
+        "limit": 10,
+        "webhook_url_template": "https://n8n.example.com/webhook/job-complete/{job_id}"
+    }
+    """
+    try:
+        body = ClaimJobsRequest.model_validate(_n8n_payload())
+    except ValidationError as e:
+        return _validation_error(e)
+    except MSGPACK_ERRORS as e:
+        return _undecodable_body(e)
+    
+    try:
+        jobs = processor.claim_pending_jobs(body.limit, body.webhook_url_template)
+        
+        return _n8n_response({
+            "success": True,
+            "total_jobs": len(jobs),
+            "jobs": jobs
+        })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -101,19 +227,20 @@ def start_job(job_id):
     }
     """
     try:
-        data = request.get_json()
-        webhook_url = data.get('webhook_url')
-        
-        if not webhook_url:
-            return jsonify({"error": "webhook_url requerido"}), 400
-        
-        processor.mark_job_processing(job_id, webhook_url)
+        body = StartJobRequest.model_validate(_n8n_payload())
+    except ValidationError as e:
+        return _validation_error(e)
+    except MSGPACK_ERRORS as e:
+        return _undecodable_body(e)
+    
+    try:
+        processor.mark_job_processing(job_id, body.webhook_url)
         
-        return jsonify({
+        return _n8n_response({
             "success": True,
             "job_id": job_id,
             "status": "processing"
-        }), 200
+        })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -123,29 +250,42 @@ def job_complete_webhook(job_id):
     """
     Webhook para recibir resultados de n8n cuando completa un trabajo
     
+    La URL (con los parámetros de firma ``t`` y ``s``) es la ``webhook_url``
+    entregada por /api/n8n/pending-jobs.
+    
     Body: {
         "processed_image_url": "https://processed-images.com/...",
         "watermarked_image_url": "https://watermarked-images.com/...",
         "status": "completed" | "failed"
     }
     """
+    # Rechazar llamadas sin firma válida antes de leer el body o tocar la BD
+    if not processor.verify_webhook_signature(job_id, request.args.get('t'), request.args.get('s')):
+        return jsonify({"error": "Firma de webhook inválida"}), 401
+    
     try:
-        data = request.get_json()
-        
-        if data.get('status') == 'completed':
-            processed_url = data.get('processed_image_url')
-            watermarked_url = data.get('watermarked_image_url')
-            
-            if not processed_url or not watermarked_url:
-                return jsonify({"error": "URLs de imagen requeridas"}), 400
-            
-            processor.complete_job(job_id, processed_url, watermarked_url)
+        body = JobCompleteRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error(e)
+    
+    try:
+        if body.status == 'completed':
+            completion = (job_id, body.processed_image_url, body.watermarked_image_url)
+            if not completion_queue.put(*completion):
+                # Cola llena o cerrándose: se guarda ya, antes de confirmar a n8n
+                if processor.complete_jobs([completion]):
+                    return jsonify({"error": "No se pudo registrar el resultado, reintentar más tarde"}), 503
+                return jsonify({
+                    "success": True,
+                    "job_id": job_id,
+                    "message": "Resultado registrado"
+                }), 200
             
             return jsonify({
                 "success": True,
                 "job_id": job_id,
-                "message": "Trabajo completado exitosamente"
-            }), 200
+                "message": "Resultado recibido, se registrará en breve"
+            }), 202
         else:
             # Manejar fallos aquí
             return jsonify({"error": "Trabajo falló"}), 400
@@ -187,9 +327,12 @@ def process_payment():
     }
     """
     try:
-        data = request.get_json()
-        request_id = data.get('request_id')
-        amount = data.get('amount', 0)
+        body = PaymentRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error(e)
+    
+    try:
+        request_id, amount = body.request_id, body.amount
         
         # Aquí irían las integraciones con Stripe, PayPal, etc.
         # Por ahora simulamos un pago exitoso
@@ -202,7 +345,7 @@ def process_payment():
             "request_id": request_id,
             "payment_status": "completed",
             "amount_paid": amount,
-            "transaction_id": f"txn_{request_id}_{int(datetime.now().timestamp())}"
+            "transaction_id": f"txn_{request_id}_{time.time_ns()}"
         }), 200
         
     except Exception as e:
@@ -220,129 +363,9 @@ def health_check():
 @app.route('/', methods=['GET'])
 def frontend_example():
     """
-    Ejemplo simple de frontend
+    Ejemplo simple de frontend (servido desde static/index.html)
     """
-    return '''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Glovo Image Processor</title>
-        <style>
-            body { font-family: Arial, sans-serif; margin: 40px; }
-            .container { max-width: 800px; margin: 0 auto; }
-            input, button { padding: 10px; margin: 10px 0; width: 100%; }
-            .result { background: #f5f5f5; padding: 20px; margin: 20px 0; border-radius: 5px; }
-            .loading { color: #666; }
-            .error { color: red; }
-            .success { color: green; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>🍕 Glovo Image Processor</h1>
-            <p>Mejora las imágenes de productos de restaurantes de Glovo usando IA</p>
-            
-            <div>
-                <input type="url" id="restaurantUrl" placeholder="URL del restaurante en Glovo" 
-                       value="https://glovoapp.com/es/en/fuengirola/la-pizza-nostra-fuengirola/">
-                <input type="email" id="userEmail" placeholder="Tu email" value="test@example.com">
-                <button onclick="processRestaurant()">🚀 Procesar Restaurante</button>
-            </div>
-            
-            <div id="result" class="result" style="display:none;"></div>
-            
-            <div id="status" style="display:none;">
-                <h3>Estado del Procesamiento</h3>
-                <div id="statusContent"></div>
-                <button onclick="checkStatus()">🔄 Actualizar Estado</button>
-            </div>
-        </div>
-        
-        <script>
-            let currentRequestId = null;
-            
-            async function processRestaurant() {
-                const url = document.getElementById('restaurantUrl').value;
-                const email = document.getElementById('userEmail').value;
-                
-                if (!url || !email) {
-                    alert('Por favor completa todos los campos');
-                    return;
-                }
-                
-                document.getElementById('result').style.display = 'block';
-                document.getElementById('result').innerHTML = '<div class="loading">🔄 Procesando solicitud...</div>';
-                
-                try {
-                    const response = await fetch('/api/process-restaurant', {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ restaurant_url: url, user_email: email })
-                    });
-                    
-                    const data = await response.json();
-                    
-                    if (data.success) {
-                        currentRequestId = data.request_id;
-                        document.getElementById('result').innerHTML = `
-                            <div class="success">
-                                <h3>✅ Solicitud Creada Exitosamente</h3>
-                                <p><strong>Request ID:</strong> ${data.request_id}</p>
-                                <p><strong>Restaurante:</strong> ${data.restaurant_name}</p>
-                                <p><strong>Productos:</strong> ${data.total_products}</p>
-                                <p><strong>Imágenes a procesar:</strong> ${data.images_to_process}</p>
-                                <p><strong>Costo estimado:</strong> €${data.estimated_cost}</p>
-                                <p><strong>Tiempo estimado:</strong> ${data.processing_time_minutes} minutos</p>
-                            </div>
-                        `;
-                        document.getElementById('status').style.display = 'block';
-                        checkStatus();
-                    } else {
-                        document.getElementById('result').innerHTML = `<div class="error">❌ Error: ${data.error}</div>`;
-                    }
-                } catch (error) {
-                    document.getElementById('result').innerHTML = `<div class="error">❌ Error de conexión: ${error.message}</div>`;
-                }
-            }
-            
-            async function checkStatus() {
-                if (!currentRequestId) return;
-                
-                try {
-                    const response = await fetch(`/api/request-status/${currentRequestId}`);
-                    const data = await response.json();
-                    
-                    if (data.error) {
-                        document.getElementById('statusContent').innerHTML = `<div class="error">❌ ${data.error}</div>`;
-                        return;
-                    }
-                    
-                    document.getElementById('statusContent').innerHTML = `
-                        <p><strong>Progreso:</strong> ${data.progress_percentage}%</p>
-                        <p><strong>Estado de trabajos:</strong> ${JSON.stringify(data.job_status)}</p>
-                        <p><strong>Imágenes completadas:</strong> ${data.completed_images.length}</p>
-                        ${data.progress_percentage === 100 ? 
-                            '<button onclick="downloadImages()">📥 Descargar Imágenes (con marca de agua)</button>' : 
-                            '<div class="loading">⏳ Procesando...</div>'
-                        }
-                    `;
-                } catch (error) {
-                    document.getElementById('statusContent').innerHTML = `<div class="error">❌ Error verificando estado: ${error.message}</div>`;
-                }
-            }
-            
-            async function downloadImages() {
-                window.open(`/api/download/${currentRequestId}?type=watermarked`, '_blank');
-            }
-            
-            // Auto-refresh cada 30 segundos si hay una solicitud activa
-            setInterval(() => {
-                if (currentRequestId) checkStatus();
-            }, 30000);
-        </script>
-    </body>
-    </html>
-    '''
+    return send_from_directory(app.static_folder, 'index.html', max_age=3600)
 
 if __name__ == '__main__':
     print("🚀 Iniciando API del procesador de imágenes de Glovo")
@@ -350,10 +373,13 @@ if __name__ == '__main__':
     print("🔗 API endpoints:")
     print("   POST /api/process-restaurant")
     print("   GET  /api/request-status/<request_id>")
+    print("   GET  /api/events/<request_id>")
     print("   GET  /api/n8n/pending-jobs")
+    print("   POST /api/n8n/claim-jobs")
     print("   POST /api/n8n/start-job/<job_id>")
     print("   POST /api/webhook/job-complete/<job_id>")
     print("   GET  /api/download/<request_id>")
     print("   POST /api/payment/process")
+    print("⚙️ Servidor: gunicorn -c gunicorn_conf.py api_example:app")
     
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    os.execvp('gunicorn', ['gunicorn', '-c', 'gunicorn_conf.py', 'api_example:app']) 
\ No newline at end of file
@@ -1,28 +1,49 @@
+import functools
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Mapping, Optional
 from urllib.parse import urlparse
 
-class Config:
-    # Database configuration
-    DATABASE_URL = os.getenv('DATABASE_URL')
-    
+# psycopg2 solo hace falta con PostgreSQL (producción)
+try:
+    import psycopg2
+    from psycopg2 import pool as pg_pool
+except ImportError:
+    psycopg2 = None
+    pg_pool = None
+
+@functools.cache
+def _build_db_config(database_url: Optional[str]) -> Mapping:
+    """Parsea DATABASE_URL una sola vez; el resultado es de solo lectura"""
     # En Railway, PostgreSQL se provee automáticamente
-    if DATABASE_URL:
-        # Producción: PostgreSQL
-        url = urlparse(DATABASE_URL)
-        DB_CONFIG = {
+    if database_url:
+        # Producción: PostgreSQL. Cualquier otro esquema es un error de
+        # configuración; mejor fallar al arrancar que conectar a ciegas
+        url = urlparse(database_url)
+        if url.scheme not in ('postgres', 'postgresql'):
+            raise ValueError(f"DATABASE_URL no soportada (esquema '{url.scheme}'), se esperaba postgresql://")
+        return MappingProxyType({
             'host': url.hostname,
             'port': url.port,
             'database': url.path[1:],  # Remove leading slash
             'user': url.username,
             'password': url.password,
             'type': 'postgresql'
-        }
-    else:
-        # Desarrollo: SQLite
-        DB_CONFIG = {
-            'path': 'glovo_products.db',
-            'type': 'sqlite'
-        }
+        })
+    
+    # Desarrollo: SQLite
+    return MappingProxyType({
+        'path': 'glovo_products.db',
+        'type': 'sqlite'
+    })
+
+class Config:
+    # Database configuration
+    DATABASE_URL = os.getenv('DATABASE_URL')
+    DB_CONFIG = _build_db_config(DATABASE_URL)
     
     # Flask configuration
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -31,6 +52,13 @@ class Config:
     # External services
     N8N_WEBHOOK_BASE = os.getenv('N8N_WEBHOOK_BASE', 'https://your-n8n-instance.com')
     
+    # URL pública de esta API (para los webhooks firmados que se entregan a n8n)
+    PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', 'https://your-domain.com').rstrip('/')
+    WEBHOOK_URL_TTL = int(os.getenv('WEBHOOK_URL_TTL', str(24 * 3600)))  # seconds
+    
+    # Servir el frontend web en / (desactivar en despliegues solo-API)
+    ENABLE_FRONTEND = os.getenv('ENABLE_FRONTEND', '1') == '1'
+    
     # File storage
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', './uploads')
     
@@ -41,30 +69,69 @@ class Config:
     PRICE_PER_IMAGE = float(os.getenv('PRICE_PER_IMAGE', '0.50'))
     PROCESSING_TIME_PER_IMAGE = int(os.getenv('PROCESSING_TIME_PER_IMAGE', '2'))  # minutes
 
+# Pool de conexiones PostgreSQL (se crea en el primer uso, uno por proceso)
+_PG_POOL = None
+_PG_POOL_LOCK = threading.Lock()
+
+def _get_pg_pool():
+    global _PG_POOL
+    if _PG_POOL is None:
+        with _PG_POOL_LOCK:
+            if _PG_POOL is None:
+                if pg_pool is None:
+                    raise RuntimeError("DATABASE_URL apunta a PostgreSQL pero psycopg2 no está instalado")
+                _PG_POOL = pg_pool.ThreadedConnectionPool(
+                    minconn=int(os.getenv('DB_POOL_MIN', '2')),
+                    maxconn=int(os.getenv('DB_POOL_MAX', '20')),
+                    host=Config.DB_CONFIG['host'],
+                    port=Config.DB_CONFIG['port'],
+                    database=Config.DB_CONFIG['database'],
+                    user=Config.DB_CONFIG['user'],
+                    password=Config.DB_CONFIG['password']
+                )
+    return _PG_POOL
+
 # Helper function to get database connection
+# (con PostgreSQL sale del pool: devolverla con put_db_connection)
 def get_db_connection():
     if Config.DB_CONFIG['type'] == 'postgresql':
-        import psycopg2
-        return psycopg2.connect(
-            host=Config.DB_CONFIG['host'],
-            port=Config.DB_CONFIG['port'],
-            database=Config.DB_CONFIG['database'],
-            user=Config.DB_CONFIG['user'],
-            password=Config.DB_CONFIG['password']
-        )
+        return _get_pg_pool().getconn()
     else:
-        import sqlite3
         return sqlite3.connect(Config.DB_CONFIG['path'])
 
+def put_db_connection(conn, close: bool = False):
+    """Devuelve una conexión obtenida con get_db_connection"""
+    if Config.DB_CONFIG['type'] == 'postgresql':
+        _get_pg_pool().putconn(conn, close=close)
+    else:
+        conn.close()
+
+@contextmanager
+def db_connection():
+    """Conexión del pool que se devuelve al salir (y se descarta si hubo error)"""
+    conn = get_db_connection()
+    try:
+        yield conn
+    except Exception:
+        put_db_connection(conn, close=True)
+        raise
+    else:
+        put_db_connection(conn)
+
+# La configuración no cambia en tiempo de ejecución: se calcula una vez al importar
+_IS_PRODUCTION = Config.DATABASE_URL is not None
+_ENV_INFO = {
+    'environment': 'production' if _IS_PRODUCTION else 'development',
+    'database_type': Config.DB_CONFIG['type'],
+    'debug': Config.DEBUG,
+    'rate_limit': Config.RATE_LIMIT_PER_MINUTE
+}
+
 # Production readiness check
 def is_production():
-    return Config.DATABASE_URL is not None
+    return _IS_PRODUCTION
 
-# Environment info
+# Environment info: copia del dict calculado al importar (se serializa con
+# jsonify, que no admite MappingProxyType, y así nadie altera el compartido)
 def get_env_info():
-    return {
-        'environment': 'production' if is_production() else 'development',
-        'database_type': Config.DB_CONFIG['type'],
-        'debug': Config.DEBUG,
-        'rate_limit': Config.RATE_LIMIT_PER_MINUTE
-    } 
\ No newline at end of file
+    return dict(_ENV_INFO)
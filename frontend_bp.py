@@ -0,0 +1,90 @@
+"""
+🖥️ Frontend web de la API de producción (blueprint)
+
+app.py solo lo registra si ``Config.ENABLE_FRONTEND`` está activo, así los
+despliegues solo-API no cargan la plantilla. La página solo depende de la
+configuración: se renderiza en la primera visita y a partir de ahí se sirve
+ya generada (y comprimida con gzip si el cliente lo acepta).
+"""
+
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional, Tuple
+
+from flask import Blueprint, current_app, render_template, request
+from config import get_env_info
+
+bp = Blueprint('frontend', __name__)
+
+# CSS y JS del frontend en static/
+ASSETS = ('app.css', 'app.js')
+
+# (html, html_gzip, etag) de la página ya renderizada
+_page: Optional[Tuple[bytes, bytes, str]] = None
+
+# Hash del contenido de cada asset, calculado en la primera consulta
+_asset_versions: Dict[str, str] = {}
+
+def _asset_version(name: str) -> str:
+    # Versión por hash del contenido: la URL cambia cuando cambia el
+    # fichero, así que el navegador puede cachearlos indefinidamente
+    if name not in _asset_versions:
+        with open(os.path.join(current_app.static_folder, name), 'rb') as f:
+            _asset_versions[name] = hashlib.md5(f.read()).hexdigest()[:10]
+    return _asset_versions[name]
+
+def _render_page() -> Tuple[bytes, bytes, str]:
+    global _page
+    if _page is None:
+        def asset_url(filename: str) -> str:
+            return f"{current_app.static_url_path}/{filename}?v={_asset_version(filename)}"
+
+        html = render_template('index.html', get_env_info=get_env_info, asset_url=asset_url).encode()
+        _page = (html, gzip.compress(html, 9), hashlib.md5(html).hexdigest())
+    return _page
+
+@bp.after_app_request
+def cache_versioned_assets(response):
+    """Cache de larga duración para los assets pedidos con ?v=<hash>
+
+    Solo si el hash coincide con el contenido actual: un ?v= antiguo o
+    inventado se queda con las cabeceras normales (revalidación por ETag).
+    """
+    prefix = f"{current_app.static_url_path}/"
+    version = request.args.get('v')
+    if version and response.status_code == 200 and request.path.startswith(prefix):
+        name = request.path[len(prefix):]
+        if name in ASSETS and version == _asset_version(name):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+@bp.route('/', methods=['GET'])
+def frontend():
+    """
+    Frontend web mejorado para producción
+
+    Se sirve ya comprimido con gzip si el cliente lo acepta, y con 304 si
+    el navegador ya tiene la versión actual.
+    """
+    html, html_gz, page_etag = _render_page()
+
+    headers = {
+        'Content-Type': 'text/html; charset=utf-8',
+        'Cache-Control': 'public, max-age=3600',
+        'Vary': 'Accept-Encoding'
+    }
+
+    # Calidad > 0: 'gzip;q=0' significa que el cliente lo rechaza
+    use_gzip = request.accept_encodings['gzip'] > 0
+    etag = f"{page_etag}-gz" if use_gzip else page_etag
+    headers['ETag'] = f'"{etag}"'
+
+    if request.if_none_match.contains(etag):
+        return '', 304, headers
+
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        return html_gz, 200, headers
+
+    return html, 200, headers
@@ -1,15 +1,179 @@
 import sqlite3
 import json
 import hashlib
+import hmac
+import operator
+import re
+import atexit
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from dataclasses import dataclass
 import logging
-from glovo_scraper_improved import GlovoScraperImproved
+from config import Config
+from glovo_scraper_improved import GlovoScraperImproved, make_session
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger("glovo-business")
 
+# Sesión HTTP compartida por el proceso: reutiliza conexiones TCP/TLS con Glovo
+# entre solicitudes en lugar de abrir una nueva por cada scraping
+SESSION = make_session(pool_size=100)
+
+MAX_RESTAURANT_URL_LENGTH = 512
+
+# Antigüedad a partir de la cual se vuelve a scrapear un restaurante
+_REFRESH_INTERVAL = timedelta(hours=24)
+
+# https://glovoapp.com/<país>/<idioma>/<ciudad>/<restaurante>/
+_GLOVO_URL_RE = re.compile(
+    r'https://(?:www\.)?glovoapp\.com/[a-z]{2}/[a-z]{2}/[\w-]+/[\w-]+/?(?:\?[^\s#]*)?'
+)
+
+# Sentencias de los caminos más frecuentes (polling de n8n y webhooks). Son
+# siempre el mismo objeto str, así la cache de sentencias preparadas de cada
+# conexión las compila una sola vez
+_SQL_SELECT_PENDING_JOBS = '''
+    SELECT id, restaurant_name, product_name, original_image_url, created_at
+    FROM image_processing_jobs 
+    WHERE status = 'pending'
+    ORDER BY created_at ASC
+    LIMIT ?
+'''
+
+# Los trabajos nuevos nunca sustituyen a uno existente: con DO NOTHING SQLite
+# se ahorra el borrado + reinserción (y el mantenimiento de índices) de REPLACE
+_SQL_INSERT_JOB = '''
+    INSERT INTO image_processing_jobs (
+        id, restaurant_url, restaurant_name, product_name, original_image_url,
+        status, created_at, updated_at, processed_image_url, watermarked_image_url,
+        n8n_webhook_url, request_id
+    ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?, ?, ?, ?)
+    ON CONFLICT(id) DO NOTHING
+'''
+
+_SQL_SAVE_JOB = '''
+    INSERT OR REPLACE INTO image_processing_jobs (
+        id, restaurant_url, restaurant_name, product_name, original_image_url,
+        status, created_at, updated_at, processed_image_url, watermarked_image_url,
+        n8n_webhook_url, request_id
+    ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?, ?, ?, ?)
+'''
+
+# Parámetros de _SQL_SAVE_JOB a partir de un ImageProcessingJob, en una sola llamada
+_JOB_ROW = operator.attrgetter(
+    'id', 'restaurant_url', 'restaurant_name', 'product_name', 'original_image_url',
+    'status', 'processed_image_url', 'watermarked_image_url', 'n8n_webhook_url', 'request_id'
+)
+
+_SQL_MARK_JOB_PROCESSING = '''
+    UPDATE image_processing_jobs 
+    SET status = 'processing', n8n_webhook_url = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+# Trabajos entregados a n8n cuyo resultado nunca llegó (o se perdió): vuelven
+# a 'pending' para que otro poller los recoja
+_SQL_REQUEUE_STUCK_JOBS = '''
+    UPDATE image_processing_jobs
+    SET status = 'pending', n8n_webhook_url = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE status = 'processing' AND updated_at < datetime('now', ?)
+'''
+
+_SQL_COMPLETE_JOB = '''
+    UPDATE image_processing_jobs 
+    SET status = 'completed', processed_image_url = ?, watermarked_image_url = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+def is_glovo_restaurant_url(url: str) -> bool:
+    """Comprueba que la URL sea la página de un restaurante de Glovo
+    
+    La longitud se comprueba antes que el patrón para descartar entradas
+    enormes sin llegar a recorrerlas.
+    """
+    if not isinstance(url, str) or len(url) > MAX_RESTAURANT_URL_LENGTH:
+        return False
+    return _GLOVO_URL_RE.fullmatch(url) is not None
+
+class _TTLCache:
+    """Cache en memoria con caducidad y tamaño máximo (descarta el menos usado)"""
+    
+    def __init__(self, ttl: float, maxsize: int = 4096):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+    
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class _ConnectionPool:
+    """Pool acotado de conexiones SQLite compartido por hilos y greenlets
+    
+    Con gevent ``threading.local`` es por greenlet: cada petición abría su
+    propia conexión y no había límite. Aquí como mucho ``maxsize`` conexiones
+    están en uso a la vez (el resto espera) y las libres se reutilizan.
+    """
+    
+    def __init__(self, connect, maxsize: int):
+        self._connect = connect
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(maxsize)
+    
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                # Nunca devolver al pool una transacción a medias
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+    
+    def close(self):
+        """Cierra las conexiones libres"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
 @dataclass
 class ImageProcessingJob:
     """Trabajo de procesamiento de imagen"""
@@ -19,11 +183,13 @@ class ImageProcessingJob:
     product_name: str
     original_image_url: str
     status: str  # pending, processing, completed, failed
-    created_at: datetime
-    updated_at: datetime
+    # Los pone SQLite (CURRENT_TIMESTAMP, UTC) al insertar/actualizar
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     processed_image_url: Optional[str] = None
     watermarked_image_url: Optional[str] = None
     n8n_webhook_url: Optional[str] = None
+    request_id: Optional[str] = None
 
 @dataclass
 class ProcessingRequest:
@@ -33,19 +199,103 @@ class ProcessingRequest:
     request_id: str
     payment_status: str  # pending, completed
     watermark_removal_paid: bool = False
+    status: str = 'queued'  # queued, scraping, ready, failed
 
 class GlovoImageProcessor:
-    def __init__(self, db_path: str = "glovo_products.db"):
+    def __init__(self, db_path: str = "glovo_products.db", scrape_workers: int = 4,
+                 status_cache_ttl: float = 3, parse_executor: Optional[Executor] = None,
+                 inflight_ttl: float = 300, status_cache_size: int = 4096,
+                 pending_jobs_cache_ttl: float = 1, db_pool_size: int = 8,
+                 download_cache_ttl: float = 300, download_cache_size: int = 256,
+                 stuck_job_timeout: float = 1800, stuck_job_sweep_interval: float = 60):
         self.db_path = db_path
-        self.scraper = GlovoScraperImproved()
+        # Un trabajo en 'processing' más de ``stuck_job_timeout`` segundos se da
+        # por perdido (webhook que no llegó, worker reciclado) y vuelve a 'pending'
+        self.stuck_job_timeout = stuck_job_timeout
+        self.stuck_job_sweep_interval = stuck_job_sweep_interval
+        self._next_stuck_sweep = 0.0
+        # Ventana en la que una solicitud idéntica (url + email) reutiliza la que está en curso
+        self.inflight_ttl = inflight_ttl
+        # Cache corto del estado de solicitudes: el frontend lo consulta en bucle
+        self.status_cache_ttl = status_cache_ttl
+        self._status_cache = _TTLCache(status_cache_ttl, status_cache_size)
+        # n8n consulta los trabajos pendientes en bucle (a veces desde varios workers)
+        self._pending_jobs_cache = _TTLCache(pending_jobs_cache_ttl, maxsize=64)
+        # Paquetes de descarga ya generados, por (request_id, tipo). Acotado como
+        # el de estado: una solicitud al 100% ya no se invalida nunca
+        self._download_cache = _TTLCache(download_cache_ttl, download_cache_size)
+        self.webhook_secret = Config.SECRET_KEY.encode()
+        self.webhook_base_url = Config.PUBLIC_BASE_URL
+        self.webhook_ttl = Config.WEBHOOK_URL_TTL
+        self._webhook_prefix = f"{self.webhook_base_url}/api/webhook/job-complete/"
+        self.session = SESSION
+        self.scraper = GlovoScraperImproved(parse_executor=parse_executor, session=self.session)
+        # Scraping en segundo plano: la API responde sin esperar a Glovo
+        self._scrape_pool = ThreadPoolExecutor(max_workers=scrape_workers, thread_name_prefix="scrape")
+        self._scrape_backlog = 0
+        self._scrape_backlog_lock = threading.Lock()
+        # Conexiones reutilizadas entre llamadas, un pool por modo (ver _db)
+        self._pools = {
+            autocommit: _ConnectionPool(lambda autocommit=autocommit: self._connect(autocommit), db_pool_size)
+            for autocommit in (False, True)
+        }
+        atexit.register(self.close)
         self._init_database()
     
+    @contextmanager
+    def _db(self, autocommit: bool = False):
+        """Conexión del pool durante el bloque ``with``
+        
+        Evita abrir el fichero y repetir los pragmas en cada llamada. Sin
+        ``autocommit`` el bloque es una transacción (commit al salir, rollback
+        si hay excepción); con ``autocommit`` la gestiona el propio método
+        (``BEGIN IMMEDIATE``).
+        """
+        with self._pools[autocommit].connection() as conn:
+            if autocommit:
+                yield conn
+            else:
+                with conn:
+                    yield conn
+    
+    def close(self):
+        """Cierra las conexiones libres de los pools"""
+        for pool in self._pools.values():
+            pool.close()
+    
+    def _connect(self, autocommit: bool = False) -> sqlite3.Connection:
+        """Abre una conexión a la BD con los pragmas de rendimiento
+        
+        Con ``autocommit=True`` la conexión no abre transacciones implícitas
+        (para los métodos que gestionan su propio ``BEGIN IMMEDIATE``).
+        """
+        # Las conexiones del pool (ver _db) viven lo que el proceso y pasan de
+        # una petición a otra, hilo o greenlet: su cache de sentencias amplia
+        # evita recompilar el SQL repetido. El pool nunca da la misma a dos
+        # usuarios a la vez, de ahí check_same_thread=False
+        if autocommit:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, cached_statements=256,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.db_path, cached_statements=256, check_same_thread=False)
+        # WAL ya queda fijado en el fichero (ver _init_database); estos
+        # pragmas son por conexión
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("PRAGMA cache_size=-20000")
+        return conn
+    
     def _init_database(self):
         """Inicializa las tablas adicionales para el procesamiento"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
             
+            # WAL: los lectores (p.ej. n8n sondeando trabajos) no se bloquean
+            # mientras se escribe. Es persistente, basta con fijarlo una vez
+            cursor.execute("PRAGMA journal_mode=WAL")
+            
             # Tabla para trabajos de procesamiento de imágenes
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS image_processing_jobs (
@@ -55,14 +305,28 @@ class GlovoImageProcessor:
                     product_name TEXT,
                     original_image_url TEXT,
                     status TEXT DEFAULT 'pending',
-                    created_at TIMESTAMP,
-                    updated_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     processed_image_url TEXT,
                     watermarked_image_url TEXT,
-                    n8n_webhook_url TEXT
+                    n8n_webhook_url TEXT,
+                    request_id TEXT
                 )
             ''')
             
+            # El polling de n8n filtra por estado y ordena por antigüedad
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_created
+                ON image_processing_jobs(status, created_at)
+            ''')
+            
+            # El estado de una solicitud se calcula a partir de sus trabajos
+            self._ensure_column(cursor, 'image_processing_jobs', 'request_id', "TEXT")
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_jobs_request_id
+                ON image_processing_jobs(request_id, status)
+            ''')
+            
             # Tabla para requests de usuarios
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS processing_requests (
@@ -71,328 +335,718 @@ class GlovoImageProcessor:
                     user_email TEXT,
                     payment_status TEXT DEFAULT 'pending',
                     watermark_removal_paid BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     total_images INTEGER,
-                    processed_images INTEGER DEFAULT 0
+                    processed_images INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'queued',
+                    error TEXT
                 )
             ''')
             
+            # Columnas añadidas después de la versión inicial
+            self._ensure_column(cursor, 'processing_requests', 'status', "TEXT DEFAULT 'queued'")
+            self._ensure_column(cursor, 'processing_requests', 'error', "TEXT")
+            
+            # Búsqueda de solicitudes en curso (deduplicación de envíos repetidos)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_requests_inflight
+                ON processing_requests(restaurant_url, user_email, status)
+            ''')
+            
+            # processed_images se mantiene al completar cada trabajo, así el
+            # progreso no depende de contar los trabajos en cada consulta
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_jobs_processed_images'")
+            if cursor.fetchone() is None:
+                cursor.execute('''
+                    CREATE TRIGGER trg_jobs_processed_images
+                    AFTER UPDATE OF status ON image_processing_jobs
+                    WHEN NEW.status = 'completed' AND OLD.status IS NOT 'completed'
+                    BEGIN
+                        UPDATE processing_requests
+                        SET processed_images = COALESCE(processed_images, 0) + 1
+                        WHERE request_id = NEW.request_id;
+                    END
+                ''')
+                # Recuento inicial para las solicitudes anteriores al trigger
+                cursor.execute('''
+                    UPDATE processing_requests
+                    SET processed_images = (
+                        SELECT COUNT(*) FROM image_processing_jobs
+                        WHERE image_processing_jobs.request_id = processing_requests.request_id
+                          AND image_processing_jobs.status = 'completed'
+                    )
+                ''')
+            
             conn.commit()
             conn.close()
             log.info("✅ Base de datos inicializada")
             
         except Exception as e:
-            log.error(f"❌ Error inicializando base de datos: {e}")
+            log.error("❌ Error inicializando base de datos: %s", e)
+    
+    def _ensure_column(self, cursor, table: str, column: str, definition: str):
+        """Añade una columna a una tabla existente si aún no la tiene"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    def _new_request_id(self, restaurant_url: str, user_email: str) -> str:
+        # time_ns: dos envíos seguidos nunca comparten semilla. Separador '|'
+        # en lugar de '_', que sí es habitual en emails y URLs
+        return hashlib.blake2b(f"{restaurant_url}|{user_email}|{time.time_ns()}".encode(), digest_size=8).hexdigest()
+    
+    def submit_restaurant_request(self, restaurant_url: str, user_email: str) -> str:
+        """Registra la solicitud y la procesa en segundo plano; devuelve el request_id
+        
+        Si ya hay una solicitud idéntica en curso se devuelve su request_id
+        en lugar de lanzar otro scraping.
+        """
+        request_id, created = self._register_or_reuse_request(restaurant_url, user_email)
+        if created:
+            with self._scrape_backlog_lock:
+                self._scrape_backlog += 1
+            try:
+                future = self._scrape_pool.submit(self.process_restaurant_request, restaurant_url, user_email, request_id)
+            except Exception as e:
+                # Pool cerrado (apagado): nadie procesará la solicitud
+                with self._scrape_backlog_lock:
+                    self._scrape_backlog -= 1
+                self._update_request_status(request_id, 'failed', error=str(e))
+                raise
+            future.add_done_callback(self._scrape_done)
+        else:
+            log.info("♻️ Reutilizando solicitud en curso %s para %s", request_id, restaurant_url)
+        return request_id
+    
+    def _scrape_done(self, future):
+        with self._scrape_backlog_lock:
+            self._scrape_backlog -= 1
+    
+    @property
+    def scrape_backlog(self) -> int:
+        """Solicitudes enviadas al pool de scraping que aún no han terminado"""
+        return self._scrape_backlog
     
-    def process_restaurant_request(self, restaurant_url: str, user_email: str) -> Dict:
-        """Procesa una solicitud de restaurante del usuario"""
+    def _register_or_reuse_request(self, restaurant_url: str, user_email: str) -> Tuple[str, bool]:
+        """Registra una solicitud nueva salvo que haya una idéntica en curso
+        
+        La comprobación y el INSERT van en la misma transacción (BEGIN IMMEDIATE)
+        para que envíos simultáneos, aunque lleguen a workers distintos,
+        acaben compartiendo un único request_id.
+        """
+        request_id = self._new_request_id(restaurant_url, user_email)
         try:
-            request_id = hashlib.md5(f"{restaurant_url}_{user_email}_{datetime.now()}".encode()).hexdigest()[:16]
+            with self._db(autocommit=True) as conn:
+                cursor = conn.cursor()
+                
+                try:
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute('''
+                        SELECT request_id FROM processing_requests
+                        WHERE restaurant_url = ? AND user_email = ?
+                          AND status IN ('queued', 'scraping')
+                          AND created_at >= datetime('now', ?)
+                        ORDER BY created_at DESC
+                        LIMIT 1
+                    ''', (restaurant_url, user_email, f"-{self.inflight_ttl} seconds"))
+                    row = cursor.fetchone()
+                    
+                    if row is None:
+                        cursor.execute('''
+                            INSERT INTO processing_requests (
+                                request_id, restaurant_url, user_email, created_at, total_images
+                            ) VALUES (?, ?, ?, CURRENT_TIMESTAMP, 0)
+                        ''', (request_id, restaurant_url, user_email))
+                    
+                    cursor.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        cursor.execute("ROLLBACK")
+                    raise
+            
+            if row is not None:
+                return row[0], False
+            return request_id, True
+            
+        except Exception as e:
+            # Sin fila registrada no hay nada que procesar ni que consultar:
+            # se propaga para que el endpoint responda con error
+            log.error("Error registrando solicitud de usuario: %s", e)
+            raise
+    
+    def process_restaurant_request(self, restaurant_url: str, user_email: str,
+                                   request_id: Optional[str] = None) -> Dict:
+        """Procesa una solicitud de restaurante del usuario
+        
+        Si ``request_id`` viene dado, la solicitud ya fue registrada por
+        ``submit_restaurant_request`` y solo se actualiza su estado.
+        """
+        if request_id is None:
+            request_id = self._new_request_id(restaurant_url, user_email)
+            self._register_user_request(request_id, restaurant_url, user_email, 0)
+        
+        result = self._process_restaurant(restaurant_url, request_id)
+        
+        if "error" in result:
+            self._update_request_status(request_id, 'failed', error=result["error"])
+        else:
+            self._update_request_status(request_id, 'ready', total_images=result["images_to_process"])
+        
+        return result
+    
+    def _process_restaurant(self, restaurant_url: str, request_id: str) -> Dict:
+        """Scraping (si hace falta) y creación de trabajos de una solicitud ya registrada"""
+        try:
+            self._update_request_status(request_id, 'scraping')
             
             # 1. Verificar si el restaurante ya está en la BD
             existing_data = self._check_existing_restaurant(restaurant_url)
             
             if existing_data:
-                log.info(f"🏪 Restaurante ya existe en BD: {existing_data['name']}")
-                log.info(f"📊 Productos: {existing_data['total_products']}, Con imágenes: {existing_data['products_with_images']}")
+                log.info("🏪 Restaurante ya existe en BD: %s", existing_data['name'])
+                log.info("📊 Productos: %s, Con imágenes: %s", existing_data['total_products'], existing_data['products_with_images'])
                 
                 # Verificar si necesita actualización (más de 24 horas)
                 if self._needs_update(existing_data['last_scraped']):
                     log.info("🔄 Datos obsoletos, actualizando...")
-                    products = self.scraper.extract_product_data(restaurant_url)
-                    if products:
-                        self.scraper.save_to_database(products)
-                        existing_data = self._check_existing_restaurant(restaurant_url)
+                    # Solo se guarda: las filas van directas al INSERT, sin ProductInfo
+                    existing_data = self.scraper.scrape_to_database(restaurant_url, self.db_path) or existing_data
             else:
                 log.info("🆕 Restaurante nuevo, extrayendo datos...")
-                products = self.scraper.extract_product_data(restaurant_url)
-                if products:
-                    self.scraper.save_to_database(products)
-                    existing_data = self._check_existing_restaurant(restaurant_url)
-                else:
+                existing_data = self.scraper.scrape_to_database(restaurant_url, self.db_path)
+                if not existing_data:
                     return {"error": "No se pudieron extraer datos del restaurante"}
             
-            # 2. Crear trabajos de procesamiento para imágenes
-            image_jobs = self._create_image_processing_jobs(restaurant_url, request_id)
-            
-            # 3. Registrar la solicitud del usuario
-            self._register_user_request(request_id, restaurant_url, user_email, len(image_jobs))
-            
             if not existing_data:
                 return {"error": "No se pudieron obtener datos del restaurante"}
             
+            # 2. Crear trabajos de procesamiento para imágenes
+            images_to_process = self._create_image_processing_jobs(restaurant_url, request_id)
+            
             return {
                 "success": True,
                 "request_id": request_id,
                 "restaurant_name": existing_data['name'],
                 "total_products": existing_data['total_products'],
-                "images_to_process": len(image_jobs),
-                "estimated_cost": len(image_jobs) * 0.50,  # Ejemplo: €0.50 por imagen
-                "processing_time_minutes": len(image_jobs) * 2,  # Ejemplo: 2 min por imagen
+                "images_to_process": images_to_process,
+                "estimated_cost": images_to_process * 0.50,  # Ejemplo: €0.50 por imagen
+                "processing_time_minutes": images_to_process * 2,  # Ejemplo: 2 min por imagen
             }
             
         except Exception as e:
-            log.error(f"❌ Error procesando solicitud: {e}")
+            log.error("❌ Error procesando solicitud: %s", e)
             return {"error": str(e)}
     
     def _check_existing_restaurant(self, restaurant_url: str) -> Optional[Dict]:
         """Verifica si el restaurante ya existe en la BD"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT url, name, last_scraped, total_products, products_with_images
-                FROM restaurants 
-                WHERE url = ?
-            ''', (restaurant_url,))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            if result:
-                return {
-                    'url': result[0],
-                    'name': result[1],
-                    'last_scraped': result[2],
-                    'total_products': result[3],
-                    'products_with_images': result[4]
-                }
-            return None
+            with self._db() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT url, name, last_scraped, total_products, products_with_images
+                    FROM restaurants 
+                    WHERE url = ?
+                ''', (restaurant_url,))
+                
+                result = cursor.fetchone()
+                
+                if result:
+                    return {
+                        'url': result[0],
+                        'name': result[1],
+                        'last_scraped': result[2],
+                        'total_products': result[3],
+                        'products_with_images': result[4]
+                    }
+                return None
             
         except Exception as e:
-            log.error(f"Error verificando restaurante existente: {e}")
+            log.error("Error verificando restaurante existente: %s", e)
             return None
     
-    def _needs_update(self, last_scraped: str) -> bool:
-        """Verifica si los datos necesitan actualización"""
+    def _needs_update(self, last_scraped: Optional[str]) -> bool:
+        """Verifica si los datos necesitan actualización
+        
+        Solo se usan los 19 primeros caracteres (``YYYY-MM-DD HH:MM:SS``):
+        microsegundos y zona horaria no cambian la decisión.
+        """
+        if not last_scraped or not isinstance(last_scraped, str):
+            return True
         try:
-            last_update = datetime.fromisoformat(last_scraped.replace('Z', '+00:00'))
-            time_diff = datetime.now() - last_update.replace(tzinfo=None)
-            return time_diff > timedelta(hours=24)
-        except:
+            last_update = datetime.fromisoformat(last_scraped[:19])
+        except ValueError:
             return True
+        return datetime.now() - last_update > _REFRESH_INTERVAL
     
-    def _create_image_processing_jobs(self, restaurant_url: str, request_id: str) -> List[ImageProcessingJob]:
-        """Crea trabajos de procesamiento para todas las imágenes del restaurante"""
+    def _create_image_processing_jobs(self, restaurant_url: str, request_id: str) -> int:
+        """Crea trabajos de procesamiento para todas las imágenes del restaurante
+        
+        Devuelve cuántos se han creado. Las filas se insertan directamente
+        como tuplas, sin pasar por ``ImageProcessingJob``.
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Obtener productos con imágenes
-            cursor.execute('''
-                SELECT name, image_url, restaurant_name
-                FROM products 
-                WHERE restaurant_url = ? AND image_url IS NOT NULL
-            ''', (restaurant_url,))
-            
-            products_with_images = cursor.fetchall()
-            conn.close()
-            
-            jobs = []
-            for product_name, image_url, restaurant_name in products_with_images:
-                job_id = hashlib.md5(f"{request_id}_{product_name}_{image_url}".encode()).hexdigest()[:12]
+            with self._db(autocommit=True) as conn:
+                cursor = conn.cursor()
                 
-                job = ImageProcessingJob(
-                    id=job_id,
-                    restaurant_url=restaurant_url,
-                    restaurant_name=restaurant_name,
-                    product_name=product_name,
-                    original_image_url=image_url,
-                    status='pending',
-                    created_at=datetime.now(),
-                    updated_at=datetime.now()
-                )
-                
-                jobs.append(job)
-                
-                # Guardar en BD
-                self._save_image_job(job)
+                try:
+                    # Lectura de productos e inserción de trabajos en una sola transacción
+                    cursor.execute('BEGIN IMMEDIATE')
+                    
+                    # Obtener productos con imágenes
+                    cursor.execute('''
+                        SELECT name, image_url, restaurant_name
+                        FROM products 
+                        WHERE restaurant_url = ? AND image_url IS NOT NULL
+                    ''', (restaurant_url,))
+                    
+                    # Mismo orden de columnas que _SQL_INSERT_JOB; executemany
+                    # consume el generador sin construir la lista de tuplas
+                    cursor.executemany(_SQL_INSERT_JOB, (
+                        (
+                            hashlib.blake2b(f"{request_id}|{product_name}|{image_url}".encode(), digest_size=6).hexdigest(),
+                            restaurant_url, restaurant_name, product_name, image_url,
+                            'pending', None, None, None, request_id
+                        )
+                        for product_name, image_url, restaurant_name in cursor.fetchall()
+                    ))
+                    # Productos repetidos (mismo nombre e imagen) comparten id y solo cuentan una vez
+                    created = cursor.rowcount
+                    cursor.execute('COMMIT')
+                except Exception:
+                    if conn.in_transaction:
+                        cursor.execute('ROLLBACK')
+                    raise
             
-            log.info(f"📷 Creados {len(jobs)} trabajos de procesamiento de imágenes")
-            return jobs
+            self._pending_jobs_cache.clear()
+            log.info("📷 Creados %d trabajos de procesamiento de imágenes", created)
+            return created
             
         except Exception as e:
-            log.error(f"Error creando trabajos de procesamiento: {e}")
-            return []
+            log.error("Error creando trabajos de procesamiento: %s", e)
+            return 0
+    
+    def _insert_image_jobs(self, cursor, jobs: List[ImageProcessingJob]):
+        """Inserta (o reemplaza) varios trabajos con un único executemany"""
+        cursor.executemany(_SQL_SAVE_JOB, map(_JOB_ROW, jobs))
     
     def _save_image_job(self, job: ImageProcessingJob):
         """Guarda un trabajo de procesamiento en la BD"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO image_processing_jobs (
-                    id, restaurant_url, restaurant_name, product_name, original_image_url,
-                    status, created_at, updated_at, processed_image_url, watermarked_image_url,
-                    n8n_webhook_url
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                job.id, job.restaurant_url, job.restaurant_name, job.product_name,
-                job.original_image_url, job.status, job.created_at, job.updated_at,
-                job.processed_image_url, job.watermarked_image_url, job.n8n_webhook_url
-            ))
-            
-            conn.commit()
-            conn.close()
+            with self._db() as conn:
+                self._insert_image_jobs(conn.cursor(), [job])
             
         except Exception as e:
-            log.error(f"Error guardando trabajo de imagen: {e}")
+            log.error("Error guardando trabajo de imagen: %s", e)
     
     def _register_user_request(self, request_id: str, restaurant_url: str, user_email: str, total_images: int):
         """Registra la solicitud del usuario"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._db() as conn:
+                conn.execute('''
+                    INSERT INTO processing_requests (
+                        request_id, restaurant_url, user_email, created_at, total_images
+                    ) VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
+                ''', (request_id, restaurant_url, user_email, total_images))
             
-            cursor.execute('''
-                INSERT INTO processing_requests (
-                    request_id, restaurant_url, user_email, created_at, total_images
-                ) VALUES (?, ?, ?, ?, ?)
-            ''', (request_id, restaurant_url, user_email, datetime.now(), total_images))
+        except Exception as e:
+            log.error("Error registrando solicitud de usuario: %s", e)
+    
+    def _update_request_status(self, request_id: str, status: str,
+                               total_images: Optional[int] = None, error: Optional[str] = None):
+        """Actualiza el estado de una solicitud (queued, scraping, ready, failed)"""
+        try:
+            with self._db() as conn:
+                conn.execute('''
+                    UPDATE processing_requests 
+                    SET status = ?, total_images = COALESCE(?, total_images), error = ?
+                    WHERE request_id = ?
+                ''', (status, total_images, error, request_id))
             
-            conn.commit()
-            conn.close()
+            self._status_cache.pop(request_id)
             
         except Exception as e:
-            log.error(f"Error registrando solicitud de usuario: {e}")
+            log.error("Error actualizando estado de solicitud: %s", e)
+    
+    def requeue_stuck_jobs(self) -> int:
+        """Devuelve a 'pending' los trabajos atascados en 'processing'
+        
+        Cubre las finalizaciones aceptadas por el webhook que no llegaron a
+        guardarse (proceso terminado con SIGKILL, worker reciclado): n8n
+        vuelve a recibir el trabajo. Devuelve cuántos se han reencolado.
+        """
+        cutoff = f"-{self.stuck_job_timeout} seconds"
+        try:
+            with self._db() as conn:
+                cursor = conn.execute('''
+                    SELECT DISTINCT request_id FROM image_processing_jobs
+                    WHERE status = 'processing' AND updated_at < datetime('now', ?)
+                ''', (cutoff,))
+                request_ids = {row[0] for row in cursor if row[0] is not None}
+                requeued = conn.execute(_SQL_REQUEUE_STUCK_JOBS, (cutoff,)).rowcount
+            
+            if requeued:
+                self._invalidate_request_caches(request_ids)
+                self._pending_jobs_cache.clear()
+                log.warning("♻️ Reencolados %d trabajos atascados en 'processing'", requeued)
+            return requeued
+        
+        except Exception as e:
+            log.error("Error reencolando trabajos atascados: %s", e)
+            return 0
+    
+    def _maybe_requeue_stuck_jobs(self):
+        """Barrido de trabajos atascados, como mucho cada ``stuck_job_sweep_interval`` segundos
+        
+        Se lanza desde las consultas de n8n, que llegan de forma continua.
+        """
+        now = time.monotonic()
+        if now < self._next_stuck_sweep:
+            return
+        self._next_stuck_sweep = now + self.stuck_job_sweep_interval
+        self.requeue_stuck_jobs()
     
     def get_pending_jobs_for_n8n(self, limit: int = 10) -> List[Dict]:
-        """Obtiene trabajos pendientes para enviar a n8n"""
+        """Obtiene trabajos pendientes para enviar a n8n (cacheado ``pending_jobs_cache_ttl`` segundos)
+        
+        Los errores de BD se propagan: un poller de n8n no debe confundirlos
+        con "no hay trabajos".
+        """
+        self._maybe_requeue_stuck_jobs()
+        key = str(limit)
+        jobs = self._pending_jobs_cache.get(key)
+        if jobs is None:
+            jobs = self._load_pending_jobs(limit)
+            self._pending_jobs_cache.put(key, jobs)
+        return jobs
+    
+    def _load_pending_jobs(self, limit: int) -> List[Dict]:
+        # El resultado está acotado por ``limit``: se lee entero y la conexión
+        # vuelve al pool antes de serializar la respuesta
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._db() as conn:
+                jobs = conn.execute(_SQL_SELECT_PENDING_JOBS, (limit,)).fetchall()
+        except Exception as e:
+            log.error("Error obteniendo trabajos pendientes: %s", e)
+            raise
+        
+        expires = int(time.time()) + self.webhook_ttl
+        return [
+            {
+                "job_id": job_id,
+                "restaurant_name": restaurant_name,
+                "product_name": product_name,
+                "image_url": image_url,
+                "created_at": created_at,
+                "webhook_url": self.sign_webhook_url(job_id, expires)
+            }
+            for job_id, restaurant_name, product_name, image_url, created_at in jobs
+        ]
+    
+    def claim_pending_jobs(self, limit: int = 10, n8n_webhook_url_template: str = '') -> List[Dict]:
+        """Reclama atómicamente hasta ``limit`` trabajos pendientes para n8n
+        
+        Equivale a pending-jobs + start-job por cada trabajo, pero en una sola
+        transacción con bloqueo de escritura: dos pollers de n8n nunca reciben
+        el mismo trabajo. ``{job_id}`` en la plantilla se sustituye por el id.
+        """
+        self._maybe_requeue_stuck_jobs()
+        try:
+            with self._db(autocommit=True) as conn:
+                cursor = conn.cursor()
+                
+                try:
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.execute(_SQL_SELECT_PENDING_JOBS, (limit,))
+                    jobs = cursor.fetchall()
+                    
+                    cursor.executemany(_SQL_MARK_JOB_PROCESSING, [
+                        (n8n_webhook_url_template.replace('{job_id}', job[0]), job[0]) for job in jobs
+                    ])
+                    cursor.execute('COMMIT')
+                except Exception:
+                    if conn.in_transaction:
+                        cursor.execute('ROLLBACK')
+                    raise
+                
+                request_ids = self._request_ids_for_jobs(cursor, [job[0] for job in jobs])
             
-            cursor.execute('''
-                SELECT id, restaurant_name, product_name, original_image_url, created_at
-                FROM image_processing_jobs 
-                WHERE status = 'pending'
-                ORDER BY created_at ASC
-                LIMIT ?
-            ''', (limit,))
-            
-            jobs = cursor.fetchall()
-            conn.close()
+            self._invalidate_request_caches(request_ids)
+            self._pending_jobs_cache.clear()
+            log.info("📤 Reclamados %d trabajos para n8n", len(jobs))
             
+            expires = int(time.time()) + self.webhook_ttl
             return [
                 {
-                    "job_id": job[0],
-                    "restaurant_name": job[1],
-                    "product_name": job[2],
-                    "image_url": job[3],
-                    "created_at": job[4],
-                    "webhook_url": f"https://your-domain.com/webhook/job-complete/{job[0]}"
+                    "job_id": job_id,
+                    "restaurant_name": restaurant_name,
+                    "product_name": product_name,
+                    "image_url": image_url,
+                    "created_at": created_at,
+                    "status": "processing",
+                    "webhook_url": self.sign_webhook_url(job_id, expires)
                 }
-                for job in jobs
+                for job_id, restaurant_name, product_name, image_url, created_at in jobs
             ]
             
         except Exception as e:
-            log.error(f"Error obteniendo trabajos pendientes: {e}")
+            log.error("Error reclamando trabajos pendientes: %s", e)
             return []
     
+    def _webhook_signature(self, job_id: str, expires: int) -> str:
+        return hmac.new(self.webhook_secret, f"{job_id}:{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+    
+    def sign_webhook_url(self, job_id: str, expires: Optional[int] = None) -> str:
+        """URL de finalización firmada (HMAC) y con caducidad para un trabajo
+        
+        Al firmar un lote se puede pasar ``expires`` para calcularlo una sola vez.
+        """
+        if expires is None:
+            expires = int(time.time()) + self.webhook_ttl
+        signature = self._webhook_signature(job_id, expires)
+        return f"{self._webhook_prefix}{job_id}?t={expires}&s={signature}"
+    
+    def verify_webhook_signature(self, job_id: str, expires: Optional[str], signature: Optional[str]) -> bool:
+        """Valida la firma de un webhook sin tocar la BD (comparación en tiempo constante)"""
+        try:
+            expires_at = int(expires)
+        except (TypeError, ValueError):
+            return False
+        
+        if time.time() > expires_at:
+            return False
+        
+        expected = self._webhook_signature(job_id, expires_at)
+        return hmac.compare_digest((signature or '').encode(), expected.encode())
+    
     def mark_job_processing(self, job_id: str, n8n_webhook_url: str):
         """Marca un trabajo como en procesamiento"""
+        self.mark_jobs_processing([(job_id, n8n_webhook_url)])
+    
+    def mark_jobs_processing(self, jobs: List[Tuple[str, str]]):
+        """Marca varios trabajos como en procesamiento en una sola transacción
+        
+        ``jobs`` es una lista de tuplas ``(job_id, n8n_webhook_url)``.
+        """
+        if not jobs:
+            return
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._db() as conn:
+                conn.executemany(_SQL_MARK_JOB_PROCESSING, [
+                    (n8n_webhook_url, job_id) for job_id, n8n_webhook_url in jobs
+                ])
+                request_ids = self._request_ids_for_jobs(conn.cursor(), [job[0] for job in jobs])
             
-            cursor.execute('''
-                UPDATE image_processing_jobs 
-                SET status = 'processing', n8n_webhook_url = ?, updated_at = ?
-                WHERE id = ?
-            ''', (n8n_webhook_url, datetime.now(), job_id))
-            
-            conn.commit()
-            conn.close()
+            self._invalidate_request_caches(request_ids)
+            self._pending_jobs_cache.clear()
             
         except Exception as e:
-            log.error(f"Error marcando trabajo como procesando: {e}")
+            log.error("Error marcando trabajo como procesando: %s", e)
     
     def complete_job(self, job_id: str, processed_image_url: str, watermarked_image_url: str):
         """Completa un trabajo de procesamiento"""
+        self.complete_jobs([(job_id, processed_image_url, watermarked_image_url)])
+    
+    def complete_jobs(self, completions: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+        """Completa varios trabajos en una sola transacción
+        
+        ``completions`` es una lista de tuplas
+        ``(job_id, processed_image_url, watermarked_image_url)``. Si el lote
+        falla se reintenta fila a fila, para que una fila problemática no
+        arrastre al resto. Devuelve las finalizaciones que no se han podido
+        guardar (lista vacía si todo ha ido bien).
+        """
+        if not completions:
+            return []
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE image_processing_jobs 
-                SET status = 'completed', processed_image_url = ?, watermarked_image_url = ?, updated_at = ?
-                WHERE id = ?
-            ''', (processed_image_url, watermarked_image_url, datetime.now(), job_id))
-            
-            conn.commit()
-            conn.close()
-            
-            log.info(f"✅ Trabajo {job_id} completado")
-            
+            self._write_completions(completions)
+            return []
         except Exception as e:
-            log.error(f"Error completando trabajo: {e}")
+            if len(completions) == 1:
+                log.error("Error completando trabajo %s: %s", completions[0][0], e)
+                return list(completions)
+            log.warning("⚠️ Error completando lote de %d trabajos (%s), se reintenta fila a fila",
+                        len(completions), e)
+        
+        failed = []
+        for completion in completions:
+            try:
+                self._write_completions([completion])
+            except Exception as e:
+                log.error("Error completando trabajo %s: %s", completion[0], e)
+                failed.append(completion)
+        return failed
+    
+    def _write_completions(self, completions: List[Tuple[str, str, str]]):
+        """Escribe las finalizaciones en una transacción (lanza la excepción si falla)"""
+        with self._db() as conn:
+            conn.executemany(_SQL_COMPLETE_JOB, [
+                (processed, watermarked, job_id) for job_id, processed, watermarked in completions
+            ])
+            request_ids = self._request_ids_for_jobs(conn.cursor(), [c[0] for c in completions])
+        
+        # Cambia el conjunto de imágenes completadas: estado y paquetes quedan obsoletos
+        self._invalidate_request_caches(request_ids)
+        
+        if len(completions) == 1:
+            log.info("✅ Trabajo %s completado", completions[0][0])
+        else:
+            log.info("✅ %d trabajos completados", len(completions))
+    
+    def _request_ids_for_jobs(self, cursor, job_ids: List[str]) -> set:
+        """Solicitudes a las que pertenecen los trabajos dados"""
+        request_ids = set()
+        # Por tramos, para no pasar del límite de parámetros de SQLite
+        for i in range(0, len(job_ids), 500):
+            chunk = job_ids[i:i + 500]
+            cursor.execute(
+                f"SELECT DISTINCT request_id FROM image_processing_jobs WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            request_ids.update(row[0] for row in cursor if row[0] is not None)
+        return request_ids
+    
+    def _invalidate_request_caches(self, request_ids):
+        """Descarta el estado y los paquetes de descarga cacheados de esas solicitudes
+        
+        El resto de solicitudes siguen sirviéndose desde la cache.
+        """
+        for request_id in request_ids:
+            self._status_cache.pop(request_id)
+            self._download_cache.pop((request_id, "watermarked"))
+            self._download_cache.pop((request_id, "premium"))
     
     def get_request_status(self, request_id: str) -> Dict:
-        """Obtiene el estado de una solicitud"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Obtener info de la solicitud
-            cursor.execute('''
-                SELECT restaurant_url, user_email, payment_status, watermark_removal_paid, 
-                       created_at, total_images
-                FROM processing_requests 
-                WHERE request_id = ?
-            ''', (request_id,))
-            
-            request_info = cursor.fetchone()
-            if not request_info:
-                return {"error": "Solicitud no encontrada"}
-            
-            # Obtener estado de los trabajos
-            cursor.execute('''
-                SELECT status, COUNT(*) as count
-                FROM image_processing_jobs 
-                WHERE id LIKE ?
-                GROUP BY status
-            ''', (f"{request_id}%",))
-            
-            job_status = dict(cursor.fetchall())
-            
-            # Obtener imágenes completadas
-            cursor.execute('''
-                SELECT product_name, processed_image_url, watermarked_image_url
-                FROM image_processing_jobs 
-                WHERE id LIKE ? AND status = 'completed'
-            ''', (f"{request_id}%",))
+        """Obtiene el estado de una solicitud (cacheado durante ``status_cache_ttl`` segundos)"""
+        cached = self._status_cache.get(request_id)
+        if cached is not None:
+            return cached
+        
+        status = self._load_request_status(request_id)
+        if "error" not in status:
+            self._status_cache.put(request_id, status)
+        return status
+    
+    @staticmethod
+    def request_status_etag(status: Dict) -> str:
+        """ETag del estado de una solicitud, a partir de los campos que cambian"""
+        parts = [
+            status.get("status"),
+            status.get("total_images"),
+            status.get("payment_status"),
+            status.get("watermark_removal_paid"),
+            status.get("error_message"),
+            sorted(status.get("job_status", {}).items()),
+            [img["processed_url"] for img in status.get("completed_images", [])]
+        ]
+        return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    
+    def watch_request_status(self, request_id: str, interval: float = 1.0, heartbeat: float = 15.0):
+        """Genera el estado de una solicitud cada vez que cambia
+        
+        Emite ``None`` como latido si pasan ``heartbeat`` segundos sin cambios
+        y termina cuando la solicitud no existe, falla o llega al 100%.
+        """
+        last_status = None
+        last_emit = time.monotonic()
+        
+        while True:
+            status = self.get_request_status(request_id)
             
-            completed_images = cursor.fetchall()
-            conn.close()
+            if status != last_status:
+                yield status
+                last_status = status
+                last_emit = time.monotonic()
+                
+                if ("error" in status or status.get("status") == 'failed'
+                        or status.get("progress_percentage") == 100):
+                    return
+            elif time.monotonic() - last_emit >= heartbeat:
+                yield None
+                last_emit = time.monotonic()
             
-            return {
-                "request_id": request_id,
-                "restaurant_url": request_info[0],
-                "user_email": request_info[1],
-                "payment_status": request_info[2],
-                "watermark_removal_paid": request_info[3],
-                "created_at": request_info[4],
-                "total_images": request_info[5],
-                "job_status": job_status,
-                "completed_images": [
-                    {
-                        "product_name": img[0],
-                        "processed_url": img[1],
-                        "watermarked_url": img[2]
-                    }
-                    for img in completed_images
-                ],
-                "progress_percentage": round((job_status.get('completed', 0) / request_info[5]) * 100, 1)
-            }
+            time.sleep(interval)
+    
+    def _load_request_status(self, request_id: str) -> Dict:
+        """Calcula el estado de una solicitud desde la BD"""
+        try:
+            with self._db() as conn:
+                cursor = conn.cursor()
+                
+                # Obtener info de la solicitud
+                cursor.execute('''
+                    SELECT restaurant_url, user_email, payment_status, watermark_removal_paid, 
+                           created_at, total_images, status, error, processed_images
+                    FROM processing_requests 
+                    WHERE request_id = ?
+                ''', (request_id,))
+                
+                request_info = cursor.fetchone()
+                if not request_info:
+                    return {"error": "Solicitud no encontrada"}
+                
+                # Estado de los trabajos e imágenes completadas en una sola pasada
+                cursor.execute('''
+                    SELECT status, product_name, processed_image_url, watermarked_image_url
+                    FROM image_processing_jobs 
+                    WHERE request_id = ?
+                ''', (request_id,))
+                
+                job_status: Dict[str, int] = {}
+                completed_images = []
+                for job_state, product_name, processed_url, watermarked_url in cursor:
+                    job_status[job_state] = job_status.get(job_state, 0) + 1
+                    if job_state == 'completed':
+                        completed_images.append({
+                            "product_name": product_name,
+                            "processed_url": processed_url,
+                            "watermarked_url": watermarked_url
+                        })
+                
+                # Sin imágenes el progreso no sale de una división: 0 mientras se
+                # scrapea y 100 si ya está lista (restaurante sin fotos), para que
+                # el stream SSE se cierre y la descarga quede disponible
+                total_images = request_info[5] or 0
+                processed_images = request_info[8] or 0
+                if total_images:
+                    progress = round(processed_images * 100 / total_images, 1)
+                else:
+                    progress = 100.0 if request_info[6] == 'ready' else 0.0
+                
+                return {
+                    "request_id": request_id,
+                    "restaurant_url": request_info[0],
+                    "user_email": request_info[1],
+                    "payment_status": request_info[2],
+                    "watermark_removal_paid": request_info[3],
+                    "created_at": request_info[4],
+                    "total_images": total_images,
+                    "processed_images": processed_images,
+                    "status": request_info[6],
+                    "error_message": request_info[7],
+                    "job_status": job_status,
+                    "completed_images": completed_images,
+                    "progress_percentage": progress
+                }
             
         except Exception as e:
-            log.error(f"Error obteniendo estado de solicitud: {e}")
+            log.error("Error obteniendo estado de solicitud: %s", e)
             return {"error": str(e)}
     
     def generate_download_package(self, request_id: str, include_watermarked: bool = True) -> Dict:
-        """Genera un paquete de descarga para el usuario"""
+        """Genera un paquete de descarga para el usuario
+        
+        El paquete solo se construye una vez por solicitud y tipo; las
+        descargas repetidas lo sirven desde memoria hasta que se completa
+        otro trabajo o caduca (``download_cache_ttl``).
+        """
+        download_type = "watermarked" if include_watermarked else "premium"
+        cached = self._download_cache.get((request_id, download_type))
+        if cached is not None:
+            return cached
+        
         try:
             status = self.get_request_status(request_id)
             if "error" in status:
@@ -414,19 +1068,119 @@ class GlovoImageProcessor:
                     "filename": f"{img['product_name'].replace(' ', '_')}.jpg"
                 })
             
-            return {
+            package = {
                 "success": True,
                 "request_id": request_id,
-                "download_type": "watermarked" if include_watermarked else "premium",
+                "download_type": download_type,
                 "total_images": len(images),
                 "images": images,
-                "zip_download_url": f"https://your-domain.com/download/zip/{request_id}?type={'watermarked' if include_watermarked else 'premium'}"
+                "zip_download_url": f"https://your-domain.com/download/zip/{request_id}?type={download_type}"
             }
+            self._download_cache.put((request_id, download_type), package)
+            return package
             
         except Exception as e:
-            log.error(f"Error generando paquete de descarga: {e}")
+            log.error("Error generando paquete de descarga: %s", e)
             return {"error": str(e)}
 
+class JobCompletionQueue:
+    """Cola acotada que persiste en segundo plano los resultados de n8n
+
+    El webhook solo encola y responde; un número fijo de workers agrupa las
+    finalizaciones que llegan en una ventana de ``batch_window`` segundos
+    (hasta ``batch_size``) y las persiste con ``processor.complete_jobs`` en
+    una sola transacción. Las que fallan (BD bloqueada, por ejemplo) se
+    reintentan hasta ``max_retries`` veces con espera exponencial desde
+    ``retry_backoff`` segundos.
+
+    Entre la respuesta 202 y la escritura nada es persistente: si el proceso
+    muere (SIGKILL, worker reciclado por gunicorn) las encoladas se pierden.
+    Esos trabajos se quedan en 'processing' y
+    ``GlovoImageProcessor.requeue_stuck_jobs`` los devuelve a 'pending' para
+    que n8n los procese de nuevo.
+    """
+
+    def __init__(self, processor: GlovoImageProcessor, maxsize: int = 1000, workers: int = 16,
+                 batch_size: int = 128, batch_window: float = 0.05,
+                 max_retries: int = 5, retry_backoff: float = 0.2):
+        self.processor = processor
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"job-completion-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+        
+        self._closing = False
+        # Apagado ordenado: no perder finalizaciones ya aceptadas
+        atexit.register(self.join)
+    
+    def put(self, job_id: str, processed_image_url: str, watermarked_image_url: str) -> bool:
+        """Encola una finalización
+        
+        Devuelve False si la cola está llena o se está cerrando: el llamador
+        debe persistirla él mismo (``processor.complete_jobs``) antes de
+        responder.
+        """
+        if self._closing:
+            return False
+        try:
+            self._queue.put_nowait((job_id, processed_image_url, watermarked_image_url))
+            return True
+        except queue.Full:
+            return False
+    
+    def qsize(self) -> int:
+        return self._queue.qsize()
+    
+    def join(self):
+        """Deja de aceptar finalizaciones y espera a que se persistan las encoladas"""
+        self._closing = True
+        self._queue.join()
+    
+    def _next_batch(self) -> List[Tuple[str, str, str]]:
+        """Bloquea hasta la primera finalización y agrupa las que lleguen justo después"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _persist(self, batch: List[Tuple[str, str, str]]):
+        """Persiste el lote reintentando solo las finalizaciones que fallan"""
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            try:
+                pending = self.processor.complete_jobs(pending)
+            except Exception as e:
+                log.error("Error en worker de finalización (%d trabajos): %s", len(pending), e)
+            if not pending:
+                return
+        log.error("❌ %d finalizaciones sin guardar tras %d intentos: %s",
+                  len(pending), self.max_retries + 1, [c[0] for c in pending])
+    
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._persist(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
 def main():
     """Función de prueba"""
     processor = GlovoImageProcessor()
@@ -1,13 +1,27 @@
 import requests
 import re
+import operator
 import json
 import sqlite3
-from typing import Dict, List, Optional
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
 from datetime import datetime
 import hashlib
 import logging
+from html import unescape
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# lxml (en C) parsea bastante más rápido que el html.parser de Python puro;
+# si no está instalado se usa este último
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
 
 # Configurar logging
 logging.basicConfig(
@@ -17,9 +31,143 @@ logging.basicConfig(
 )
 log = logging.getLogger("glovo-improved-scraper")
 
+# Patrones compilados una vez: se aplican a cada producto de la página
+_PRICE_RE = re.compile(r'(\d+,\d+|\d+\.\d+|\d+)')
+_DISCOUNT_RE = re.compile(r'-(\d+)%')
+_Q_AUTO_RE = re.compile(r'q_auto[^,]*')
+_WIDTH_RE = re.compile(r'w_\d+')
+_HEIGHT_RE = re.compile(r'h_\d+')
+_IMAGE_ID_RE = re.compile(r'/([a-f0-9-]{36})\.')
+_SLUG_RE = re.compile(r'[^a-zA-Z0-9]+')
+
+# Extracción rápida sobre el HTML en bruto (ver _extract_products_fast). Solo
+# acepta elementos cuyo contenido es texto plano; si hay marcado anidado o
+# algo ambiguo se vuelve al parseo con BeautifulSoup
+_ROW_MARKER = 'data-test-id="product-row-content"'
+_TITLE_RE = re.compile(r'<title[^>]*>([^<]*)</title>', re.IGNORECASE)
+_FIELD_RES = {
+    test_id: re.compile(r'data-test-id="%s"[^>]*>([^<]*)</' % test_id)
+    for test_id in (
+        'product-row-name__highlighter',
+        'product-row-description__highlighter',
+        'product-row-price',
+        'product-row-promotion',
+    )
+}
+_IMG_MARKER = 'data-test-id="img-formats"'
+_IMG_TAG_RE = re.compile(r'<img\b[^>]*\bdata-test-id="img-formats"[^>]*>')
+_SRC_RE = re.compile(r'\ssrc="([^"]*)"')
+
+# data-test-id de los elementos que se leen de cada fila en el parseo con
+# BeautifulSoup (se buscan todos en un único recorrido de la fila)
+_ROW_FIELD_IDS = frozenset((
+    'product-row-name__highlighter',
+    'product-row-description__highlighter',
+    'product-row-price',
+    'img-formats',
+    'product-row-promotion',
+))
+
+_TAG_NAME_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9]*)')
+
+@lru_cache(maxsize=8)
+def _tag_re(tag: str) -> 're.Pattern':
+    """Apertura o cierre de una etiqueta concreta (grupo 1 = '/' si es cierre)"""
+    return re.compile(r'<(/?)%s\b' % tag, re.IGNORECASE)
+
+def _row_segments(html: str) -> Optional[List[str]]:
+    """HTML de cada fila de producto, desde su marcador hasta el cierre del elemento
+    
+    Cuenta aperturas y cierres de la etiqueta de la fila para encontrar su
+    cierre: lo que haya entre filas (imágenes, promociones) no se atribuye a
+    la anterior. Devuelve None si alguna fila no se puede delimitar (cierre
+    no encontrado o filas anidadas).
+    """
+    segments = []
+    start = html.find(_ROW_MARKER)
+    while start != -1:
+        tag_start = html.rfind('<', 0, start)
+        tag_name = _TAG_NAME_RE.match(html, tag_start) if tag_start != -1 else None
+        if tag_name is None:
+            return None
+        
+        depth = 0
+        end = None
+        for tag in _tag_re(tag_name.group(1)).finditer(html, tag_start):
+            depth += -1 if tag.group(1) else 1
+            if depth == 0:
+                end = tag.start()
+                break
+        if end is None:
+            return None
+        
+        segment = html[start + len(_ROW_MARKER):end]
+        if _ROW_MARKER in segment:
+            return None
+        segments.append(segment)
+        start = html.find(_ROW_MARKER, end)
+    return segments
+
+def _fast_field(segment: str, test_id: str) -> Optional[str]:
+    """Texto de un elemento de la fila, o None si la fila no lo tiene
+    
+    Lanza ValueError si el elemento aparece pero no se puede leer sin DOM.
+    """
+    marker = f'data-test-id="{test_id}"'
+    occurrences = segment.count(marker)
+    if occurrences == 0:
+        return None
+    match = _FIELD_RES[test_id].search(segment)
+    if occurrences > 1 or match is None:
+        raise ValueError(test_id)
+    return unescape(match.group(1)).strip()
+
+# Precios y categorías se repiten mucho entre filas (y entre restaurantes):
+# se calculan una vez por texto distinto
+@lru_cache(maxsize=4096)
+def _price_value(price_text: str) -> float:
+    """Precio numérico de un texto como '12,50 €'; 0.0 si no tiene"""
+    price_match = _PRICE_RE.search(price_text.replace('€', '').replace(',', '.'))
+    if price_match:
+        return float(price_match.group(1))
+    return 0.0
+
+@lru_cache(maxsize=1024)
+def _slug(text: str) -> str:
+    return _SLUG_RE.sub('-', text.lower()).strip('-')
+
+# Igual con las URLs de imagen: los productos repetidos (y los de una misma
+# cadena) comparten imagen
+@lru_cache(maxsize=4096)
+def _hq_image_url(image_url: str) -> str:
+    """URL de Cloudinary con parámetros de alta calidad"""
+    if 'cloudinary.com' in image_url:
+        # Reemplazar parámetros de baja calidad con alta calidad
+        improved_url = _Q_AUTO_RE.sub('q_auto:best', image_url)
+        improved_url = _WIDTH_RE.sub('w_800', improved_url)
+        return _HEIGHT_RE.sub('h_800', improved_url)
+    return image_url
+
+@lru_cache(maxsize=4096)
+def _image_id(image_url: str) -> Optional[str]:
+    """ID (UUID) de la imagen en una URL de Cloudinary"""
+    match = _IMAGE_ID_RE.search(image_url)
+    if match:
+        return match.group(1)
+    return None
+
 @dataclass
 class ProductInfo:
     """Estructura de datos para productos"""
+    # Sin __dict__ por instancia: una página genera cientos de productos.
+    # (dataclass(slots=True) requiere Python 3.10; la imagen usa 3.9)
+    __slots__ = (
+        'id', 'external_id', 'store_product_id', 'name', 'description', 'price',
+        'price_display', 'category', 'category_id', 'image_url', 'image_id',
+        'has_promotions', 'promotion_discount', 'restaurant_url', 'restaurant_name',
+        'scraped_at'
+    )
+    
     id: int
     external_id: str
     store_product_id: str
@@ -37,9 +185,68 @@ class ProductInfo:
     restaurant_name: str
     scraped_at: datetime
 
+# Fila de la tabla products tal y como se inserta: los campos de ProductInfo
+# en orden y el url_hash al final
+ProductRow = Tuple
+_PRODUCT_VALUES = operator.attrgetter(*ProductInfo.__slots__)
+_ROW_NAME = ProductInfo.__slots__.index('name')
+_ROW_PRICE = ProductInfo.__slots__.index('price')
+_ROW_RESTAURANT_URL = ProductInfo.__slots__.index('restaurant_url')
+
+def _url_hash(restaurant_url: str, name: str, price: float) -> str:
+    """Hash único para evitar duplicados
+    
+    Solo es clave de deduplicación: BLAKE2b de 16 bytes, más rápido que MD5
+    y misma longitud.
+    """
+    return hashlib.blake2b(f"{restaurant_url}_{name}_{price}".encode(), digest_size=16).hexdigest()
+
+@lru_cache(maxsize=1)
+def _page_parser() -> "GlovoScraperImproved":
+    """Instancia reutilizada por cada proceso del pool de parseo"""
+    return GlovoScraperImproved()
+
+def parse_restaurant_page(html: str, restaurant_url: str, as_rows: bool = False) -> List[Union[ProductInfo, ProductRow]]:
+    """
+    Parsea el HTML de un restaurante y devuelve sus productos
+    
+    Es una función de módulo para que pueda enviarse (pickle) a un
+    ProcessPoolExecutor: BeautifulSoup es CPU-bound y apenas libera el GIL.
+    """
+    return _page_parser()._parse_page(html, restaurant_url, as_rows)
+
+def make_session(pool_size: int = 50) -> requests.Session:
+    """
+    Sesión HTTP con pool de conexiones amplio y reintentos
+
+    El adaptador por defecto solo guarda 10 conexiones por host: con varios
+    scrapings concurrentes las sobrantes se cierran y cada una vuelve a pagar
+    el handshake TCP/TLS. Los 429/5xx transitorios se reintentan con backoff.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        # Agotados los reintentos se devuelve la última respuesta (sin RetryError)
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504],
+                          raise_on_status=False)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
 class GlovoScraperImproved:
-    def __init__(self):
-        self.session = requests.Session()
+    def __init__(self, timeout: float = 30, parse_executor: Optional[Executor] = None,
+                 session: Optional[requests.Session] = None, fast_parse: bool = True):
+        # Sin timeout una página lenta bloquea el worker/greenlet indefinidamente
+        self.timeout = timeout
+        # Intentar primero la extracción con regex sobre el HTML en bruto
+        self.fast_parse = fast_parse
+        # Si se indica (p.ej. un ProcessPoolExecutor), el parseo del HTML se hace
+        # fuera del proceso web; la descarga sigue haciéndose aquí
+        self.parse_executor = parse_executor
+        # Permite compartir una sesión (y su pool de conexiones) entre scrapers
+        self.session = session or make_session()
         self.session.headers.update({
             'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
             'accept-language': 'en-GB,en;q=0.9',
@@ -50,20 +257,7 @@ class GlovoScraperImproved:
     def extract_product_data(self, restaurant_url: str) -> List[ProductInfo]:
         """Extrae datos de productos de un restaurante usando requests"""
         try:
-            log.info(f"🌐 Obteniendo datos de: {restaurant_url}")
-            
-            response = self.session.get(restaurant_url)
-            response.raise_for_status()
-            
-            # Parse HTML con BeautifulSoup
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extraer información del restaurante
-            restaurant_name = self._extract_restaurant_name(soup)
-            log.info(f"🏪 Restaurante: {restaurant_name}")
-            
-            # Extraer productos desde HTML
-            products = self._extract_products_from_html(soup, restaurant_url, restaurant_name)
+            products = self._fetch_and_parse(restaurant_url)
             
             log.info(f"✅ Extraídos {len(products)} productos")
             log.info(f"🖼️ Productos con imágenes: {sum(1 for p in products if p.image_url)}")
@@ -75,6 +269,180 @@ class GlovoScraperImproved:
             log.error(f"❌ Error procesando {restaurant_url}: {e}")
             return []
     
+    def scrape_to_database(self, restaurant_url: str, db_path: str = "glovo_products.db") -> Optional[Dict]:
+        """Extrae un restaurante y lo guarda directamente en la base de datos
+        
+        Para quien solo necesita guardar: las filas se generan como tuplas
+        listas para el INSERT, sin crear un ProductInfo por producto.
+        Devuelve el mismo resumen que ``save_to_database``, o None si no se
+        extrajo ningún producto o falla el guardado.
+        """
+        try:
+            rows = self._fetch_and_parse(restaurant_url, as_rows=True)
+        except Exception as e:
+            log.error(f"❌ Error procesando {restaurant_url}: {e}")
+            return None
+        
+        log.info(f"✅ Extraídos {len(rows)} productos")
+        if not rows:
+            return None
+        return self._save_rows(rows, db_path)
+    
+    def _fetch_and_parse(self, restaurant_url: str, as_rows: bool = False) -> List[Union[ProductInfo, ProductRow]]:
+        """Descarga la página del restaurante y la parsea (en parse_executor si lo hay)"""
+        log.info(f"🌐 Obteniendo datos de: {restaurant_url}")
+        
+        with self.session.get(restaurant_url, timeout=self.timeout, stream=True) as response:
+            # 4xx/5xx son respuestas esperables (restaurante retirado, bloqueo):
+            # se tratan como página sin productos, sin lanzar excepción
+            if response.status_code >= 400:
+                log.error(f"❌ HTTP {response.status_code} obteniendo {restaurant_url}")
+                return []
+            html = response.text
+        
+        if self.parse_executor is not None:
+            return self.parse_executor.submit(parse_restaurant_page, html, restaurant_url, as_rows).result()
+        return self._parse_page(html, restaurant_url, as_rows)
+    
+    def extract_many(self, restaurant_urls: List[str], max_workers: int = 10) -> Dict[str, List[ProductInfo]]:
+        """Extrae varios restaurantes a la vez
+        
+        El scraping está dominado por la latencia de red: con ``max_workers``
+        descargas simultáneas (sobre la misma sesión y su pool de conexiones)
+        el tiempo total se acerca al del restaurante más lento. Devuelve los
+        productos por URL; las que fallan quedan con lista vacía.
+        """
+        urls = list(dict.fromkeys(restaurant_urls))
+        if not urls:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls)), thread_name_prefix="scrape-many") as pool:
+            return dict(zip(urls, pool.map(self.extract_product_data, urls)))
+    
+    def _parse_page(self, html: str, restaurant_url: str, as_rows: bool = False) -> List[Union[ProductInfo, ProductRow]]:
+        """Parsea el HTML descargado (parte CPU-bound del scraping)
+        
+        Con ``as_rows`` devuelve las filas para el INSERT en lugar de ProductInfo.
+        """
+        if self.fast_parse:
+            products = self._extract_products_fast(html, restaurant_url, as_rows)
+            if products is not None:
+                return products
+            log.info("🐢 Marcado no reconocido, usando BeautifulSoup")
+        
+        # Parse HTML con BeautifulSoup
+        soup = BeautifulSoup(html, HTML_PARSER)
+        
+        # Extraer información del restaurante
+        restaurant_name = self._extract_restaurant_name(soup)
+        log.info(f"🏪 Restaurante: {restaurant_name}")
+        
+        # Extraer productos desde HTML
+        return self._extract_products_from_html(soup, restaurant_url, restaurant_name, as_rows)
+    
+    def _extract_products_fast(self, html: str, restaurant_url: str,
+                               as_rows: bool = False) -> Optional[List[Union[ProductInfo, ProductRow]]]:
+        """Extrae los productos con regex, sin construir el árbol DOM
+        
+        Devuelve None si la página no encaja con el marcado esperado (sin
+        título reconocible, sin filas, o algún campo con marcado anidado o
+        repetido); en ese caso hay que usar BeautifulSoup.
+        """
+        title = _TITLE_RE.search(html)
+        if not title:
+            return None
+        title_text = unescape(title.group(1))
+        for separator in [" delivery", " a domicilio"]:
+            if separator in title_text:
+                restaurant_name = title_text.split(separator)[0].strip()
+                break
+        else:
+            return None
+        log.info(f"🏪 Restaurante: {restaurant_name}")
+        
+        # Cada fila va desde su marcador hasta el cierre de su elemento
+        segments = _row_segments(html)
+        if not segments:
+            return None
+        
+        build = self._build_row if as_rows else self._build_product
+        products = []
+        current_category = "Unknown Category"
+        # Misma marca de tiempo para toda la página (datetime es inmutable)
+        scraped_at = datetime.now()
+        try:
+            for idx, segment in enumerate(segments):
+                name = _fast_field(segment, 'product-row-name__highlighter')
+                if not name:
+                    continue
+                
+                image_url = None
+                img_count = segment.count(_IMG_MARKER)
+                if img_count:
+                    img_tag = _IMG_TAG_RE.search(segment)
+                    if img_count > 1 or img_tag is None:
+                        raise ValueError('img-formats')
+                    src = _SRC_RE.search(img_tag.group(0))
+                    image_url = (unescape(src.group(1)) or None) if src else None
+                
+                promotion_text = _fast_field(segment, 'product-row-promotion')
+                products.append(build(
+                    idx, name,
+                    _fast_field(segment, 'product-row-description__highlighter') or "",
+                    _fast_field(segment, 'product-row-price') or "",
+                    image_url, promotion_text, current_category,
+                    restaurant_url, restaurant_name, scraped_at
+                ))
+        except ValueError as e:
+            log.info(f"Campo {e} no legible sin DOM")
+            return None
+        
+        log.info(f"📦 Encontrados {len(segments)} elementos de productos")
+        return products
+    
+    def _build_product(self, *row_data) -> ProductInfo:
+        """Construye el ProductInfo de una fila (común a los dos métodos de extracción)"""
+        return ProductInfo(*self._product_values(*row_data))
+    
+    def _build_row(self, *row_data) -> ProductRow:
+        """Como _build_product, pero devuelve directamente la fila para el INSERT"""
+        values = self._product_values(*row_data)
+        return values + (_url_hash(values[_ROW_RESTAURANT_URL], values[_ROW_NAME], values[_ROW_PRICE]),)
+    
+    def _product_values(self, idx: int, name: str, description: str, price_display: str,
+                        image_url: Optional[str], promotion_text: Optional[str], category: str,
+                        restaurant_url: str, restaurant_name: str, scraped_at: datetime) -> tuple:
+        """Valores de los campos de ProductInfo, en orden, para una fila de la página"""
+        # Convertir a URL de alta calidad si es de Cloudinary
+        if image_url and 'cloudinary.com' in image_url:
+            image_url = self._improve_image_url(image_url)
+        
+        # Detectar promociones
+        promotion_discount = None
+        if promotion_text is not None:
+            discount_match = _DISCOUNT_RE.search(promotion_text)
+            if discount_match:
+                promotion_discount = int(discount_match.group(1))
+        
+        return (
+            idx + 1,  # ID secuencial
+            f"html_{idx}",
+            f"store_{idx}",
+            name,
+            description,
+            self._parse_price(price_display),
+            price_display,
+            category,
+            self._slugify(category),
+            image_url,
+            self._extract_image_id(image_url),
+            promotion_text is not None,
+            promotion_discount,
+            restaurant_url,
+            restaurant_name,
+            scraped_at
+        )
+    
     def _extract_restaurant_name(self, soup: BeautifulSoup) -> str:
         """Extrae el nombre del restaurante del HTML"""
         try:
@@ -101,8 +469,10 @@ class GlovoScraperImproved:
             log.warning(f"Error extrayendo nombre del restaurante: {e}")
             return "Unknown Restaurant"
     
-    def _extract_products_from_html(self, soup: BeautifulSoup, restaurant_url: str, restaurant_name: str) -> List[ProductInfo]:
+    def _extract_products_from_html(self, soup: BeautifulSoup, restaurant_url: str, restaurant_name: str,
+                                    as_rows: bool = False) -> List[Union[ProductInfo, ProductRow]]:
         """Extrae productos desde el HTML renderizado"""
+        build = self._build_row if as_rows else self._build_product
         products = []
         
         try:
@@ -111,11 +481,22 @@ class GlovoScraperImproved:
             log.info(f"📦 Encontrados {len(product_rows)} elementos de productos")
             
             current_category = "Unknown Category"
+            # Misma marca de tiempo para toda la página (datetime es inmutable)
+            scraped_at = datetime.now()
             
             for idx, product_row in enumerate(product_rows):
                 try:
+                    # Un solo recorrido de la fila: primer elemento de cada data-test-id
+                    elements = {}
+                    for element in product_row.find_all(attrs={'data-test-id': _ROW_FIELD_IDS}):
+                        test_id = element['data-test-id']
+                        # img-formats también lo lleva el <picture> que envuelve al <img>
+                        if test_id == 'img-formats' and element.name != 'img':
+                            continue
+                        elements.setdefault(test_id, element)
+                    
                     # Extraer nombre del producto
-                    name_element = product_row.find(attrs={'data-test-id': 'product-row-name__highlighter'})
+                    name_element = elements.get('product-row-name__highlighter')
                     if not name_element:
                         continue
                     
@@ -124,55 +505,27 @@ class GlovoScraperImproved:
                         continue
                     
                     # Extraer descripción
-                    desc_element = product_row.find(attrs={'data-test-id': 'product-row-description__highlighter'})
+                    desc_element = elements.get('product-row-description__highlighter')
                     description = desc_element.get_text(strip=True) if desc_element else ""
                     
                     # Extraer precio
-                    price_element = product_row.find(attrs={'data-test-id': 'product-row-price'})
+                    price_element = elements.get('product-row-price')
                     price_display = price_element.get_text(strip=True) if price_element else ""
-                    price = self._parse_price(price_display)
                     
                     # Extraer imagen
                     image_url = None
-                    img_element = product_row.find('img', {'data-test-id': 'img-formats'})
+                    img_element = elements.get('img-formats')
                     if img_element and img_element.get('src'):
                         image_url = img_element['src']
-                        # Convertir a URL de alta calidad si es de Cloudinary
-                        if 'cloudinary.com' in image_url:
-                            image_url = self._improve_image_url(image_url)
                     
                     # Detectar promociones
-                    promotion_element = product_row.find(attrs={'data-test-id': 'product-row-promotion'})
-                    has_promotions = promotion_element is not None
-                    promotion_discount = None
-                    
-                    if has_promotions:
-                        promotion_text = promotion_element.get_text(strip=True)
-                        discount_match = re.search(r'-(\d+)%', promotion_text)
-                        if discount_match:
-                            promotion_discount = int(discount_match.group(1))
-                    
-                    # Crear producto
-                    product = ProductInfo(
-                        id=idx + 1,  # ID secuencial
-                        external_id=f"html_{idx}",
-                        store_product_id=f"store_{idx}",
-                        name=name,
-                        description=description,
-                        price=price,
-                        price_display=price_display,
-                        category=current_category,
-                        category_id=self._slugify(current_category),
-                        image_url=image_url,
-                        image_id=self._extract_image_id(image_url),
-                        has_promotions=has_promotions,
-                        promotion_discount=promotion_discount,
-                        restaurant_url=restaurant_url,
-                        restaurant_name=restaurant_name,
-                        scraped_at=datetime.now()
-                    )
+                    promotion_element = elements.get('product-row-promotion')
+                    promotion_text = promotion_element.get_text(strip=True) if promotion_element is not None else None
                     
-                    products.append(product)
+                    products.append(build(
+                        idx, name, description, price_display, image_url, promotion_text,
+                        current_category, restaurant_url, restaurant_name, scraped_at
+                    ))
                     
                 except Exception as e:
                     log.warning(f"⚠️ Error procesando producto {idx}: {e}")
@@ -186,24 +539,14 @@ class GlovoScraperImproved:
     def _parse_price(self, price_text: str) -> float:
         """Extrae el precio numérico del texto"""
         try:
-            # Buscar números con comas decimales
-            price_match = re.search(r'(\d+,\d+|\d+\.\d+|\d+)', price_text.replace('€', '').replace(',', '.'))
-            if price_match:
-                return float(price_match.group(1))
-            return 0.0
+            return _price_value(price_text)
         except:
             return 0.0
     
     def _improve_image_url(self, image_url: str) -> str:
         """Mejora la calidad de las URLs de Cloudinary"""
         try:
-            if 'cloudinary.com' in image_url:
-                # Reemplazar parámetros de baja calidad con alta calidad
-                improved_url = re.sub(r'q_auto[^,]*', 'q_auto:best', image_url)
-                improved_url = re.sub(r'w_\d+', 'w_800', improved_url)
-                improved_url = re.sub(r'h_\d+', 'h_800', improved_url)
-                return improved_url
-            return image_url
+            return _hq_image_url(image_url)
         except:
             return image_url
     
@@ -212,99 +555,133 @@ class GlovoScraperImproved:
         if not image_url:
             return None
         try:
-            # Extraer ID de URLs de Cloudinary
-            match = re.search(r'/([a-f0-9-]{36})\.', image_url)
-            if match:
-                return match.group(1)
-            return None
+            return _image_id(image_url)
         except:
             return None
     
     def _slugify(self, text: str) -> str:
         """Convierte texto a slug"""
-        return re.sub(r'[^a-zA-Z0-9]+', '-', text.lower()).strip('-')
+        return _slug(text)
     
-    def save_to_database(self, products: List[ProductInfo], db_path: str = "glovo_products.db"):
-        """Guarda los productos en una base de datos SQLite"""
+    def save_to_database(self, products: List[ProductInfo], db_path: str = "glovo_products.db") -> Optional[Dict]:
+        """Guarda los productos en una base de datos SQLite
+        
+        Devuelve el resumen del restaurante tal y como queda en la tabla
+        ``restaurants`` (url, name, last_scraped, total_products,
+        products_with_images), o None si no hay productos o falla el guardado.
+        """
+        return self._save_rows([_PRODUCT_VALUES(product) + (_url_hash(product.restaurant_url, product.name, product.price),)
+                                for product in products], db_path)
+    
+    def _save_rows(self, rows: List[ProductRow], db_path: str) -> Optional[Dict]:
+        """Guarda las filas de un restaurante (ver save_to_database)"""
         try:
             conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Crear tabla si no existe
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY,
-                    external_id TEXT,
-                    store_product_id TEXT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    price REAL,
-                    price_display TEXT,
-                    category TEXT,
-                    category_id TEXT,
-                    image_url TEXT,
-                    image_id TEXT,
-                    has_promotions BOOLEAN,
-                    promotion_discount REAL,
-                    restaurant_url TEXT,
-                    restaurant_name TEXT,
-                    scraped_at TIMESTAMP,
-                    url_hash TEXT UNIQUE
-                )
-            ''')
-            
-            # Crear tabla para restaurantes
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS restaurants (
-                    url TEXT PRIMARY KEY,
-                    name TEXT,
-                    last_scraped TIMESTAMP,
-                    total_products INTEGER,
-                    products_with_images INTEGER
-                )
-            ''')
-            
-            # Insertar productos
-            for product in products:
-                # Crear hash único para evitar duplicados
-                url_hash = hashlib.md5(f"{product.restaurant_url}_{product.name}_{product.price}".encode()).hexdigest()
+            try:
+                # WAL + synchronous=NORMAL: el commit no espera a un fsync
+                # completo y los lectores no bloquean la escritura
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
                 
-                cursor.execute('''
-                    INSERT OR REPLACE INTO products (
-                        id, external_id, store_product_id, name, description, price,
-                        price_display, category, category_id, image_url, image_id,
-                        has_promotions, promotion_discount, restaurant_url, restaurant_name,
-                        scraped_at, url_hash
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    product.id, product.external_id, product.store_product_id,
-                    product.name, product.description, product.price,
-                    product.price_display, product.category, product.category_id,
-                    product.image_url, product.image_id, product.has_promotions,
-                    product.promotion_discount, product.restaurant_url, product.restaurant_name,
-                    product.scraped_at, url_hash
-                ))
-            
-            # Actualizar tabla de restaurantes
-            if products:
-                restaurant_url = products[0].restaurant_url
-                restaurant_name = products[0].restaurant_name
-                total_products = len(products)
-                products_with_images = sum(1 for p in products if p.image_url)
-                
-                cursor.execute('''
-                    INSERT OR REPLACE INTO restaurants (
-                        url, name, last_scraped, total_products, products_with_images
-                    ) VALUES (?, ?, ?, ?, ?)
-                ''', (restaurant_url, restaurant_name, datetime.now(), total_products, products_with_images))
-            
-            conn.commit()
-            conn.close()
+                # Todo el guardado en una transacción (commit/rollback al salir)
+                with conn:
+                    cursor = conn.cursor()
+                    
+                    # Crear tabla si no existe
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS products (
+                            id INTEGER PRIMARY KEY,
+                            external_id TEXT,
+                            store_product_id TEXT,
+                            name TEXT NOT NULL,
+                            description TEXT,
+                            price REAL,
+                            price_display TEXT,
+                            category TEXT,
+                            category_id TEXT,
+                            image_url TEXT,
+                            image_id TEXT,
+                            has_promotions BOOLEAN,
+                            promotion_discount REAL,
+                            restaurant_url TEXT,
+                            restaurant_name TEXT,
+                            scraped_at TIMESTAMP,
+                            url_hash TEXT UNIQUE
+                        )
+                    ''')
+                    
+                    # Productos de un restaurante (creación de trabajos, estadísticas)
+                    # y agrupación por categoría
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_restaurant ON products(restaurant_url)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON products(category)')
+                    
+                    # Crear tabla para restaurantes
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS restaurants (
+                            url TEXT PRIMARY KEY,
+                            name TEXT,
+                            last_scraped TIMESTAMP,
+                            total_products INTEGER,
+                            products_with_images INTEGER
+                        )
+                    ''')
+                    
+                    if not rows:
+                        return None
+                    restaurant_url = rows[0][_ROW_RESTAURANT_URL]
+                    
+                    # La lista es el menú completo: se quitan las filas de la
+                    # extracción anterior que ya no aparecen en él
+                    cursor.execute('DELETE FROM products WHERE restaurant_url = ?', (restaurant_url,))
+                    
+                    # Insertar productos: todas las filas en un único executemany.
+                    # El id de la fila es la posición en la página (1..N en todos
+                    # los restaurantes): no se guarda y SQLite asigna uno propio, o
+                    # el REPLACE pisaría los productos de otros restaurantes
+                    cursor.executemany('''
+                        INSERT OR REPLACE INTO products (
+                            external_id, store_product_id, name, description, price,
+                            price_display, category, category_id, image_url, image_id,
+                            has_promotions, promotion_discount, restaurant_url, restaurant_name,
+                            scraped_at, url_hash
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (row[1:] for row in rows))
+                    
+                    # Actualizar tabla de restaurantes: los totales los calcula
+                    # SQLite sobre las filas recién guardadas (índice por restaurante).
+                    # last_scraped sigue en hora local, como la compara _needs_update
+                    cursor.execute('''
+                        INSERT OR REPLACE INTO restaurants (
+                            url, name, last_scraped, total_products, products_with_images
+                        )
+                        SELECT restaurant_url, MAX(restaurant_name), ?, COUNT(*), COUNT(image_url)
+                        FROM products
+                        WHERE restaurant_url = ?
+                        GROUP BY restaurant_url
+                    ''', (datetime.now(), restaurant_url))
+                    
+                    cursor.execute('''
+                        SELECT url, name, last_scraped, total_products, products_with_images
+                        FROM restaurants WHERE url = ?
+                    ''', (restaurant_url,))
+                    url, name, last_scraped, total_products, products_with_images = cursor.fetchone()
+                    summary = {
+                        'url': url,
+                        'name': name,
+                        'last_scraped': last_scraped,
+                        'total_products': total_products,
+                        'products_with_images': products_with_images
+                    }
             
-            log.info(f"💾 Guardados {len(products)} productos en la base de datos")
+            finally:
+                conn.close()
             
+            log.info(f"💾 Guardados {len(rows)} productos en la base de datos")
+            return summary
+        
         except Exception as e:
             log.error(f"❌ Error guardando en base de datos: {e}")
+            return None
     
     def get_stats_from_database(self, db_path: str = "glovo_products.db") -> Dict:
         """Obtiene estadísticas de la base de datos"""
@@ -312,18 +689,13 @@ class GlovoScraperImproved:
             conn = sqlite3.connect(db_path)
             cursor = conn.cursor()
             
-            # Estadísticas generales
-            cursor.execute("SELECT COUNT(*) FROM products")
-            total_products = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM products WHERE image_url IS NOT NULL")
-            products_with_images = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(DISTINCT restaurant_url) FROM products")
-            total_restaurants = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(DISTINCT category) FROM products")
-            total_categories = cursor.fetchone()[0]
+            # Estadísticas generales en una sola pasada por la tabla
+            cursor.execute('''
+                SELECT COUNT(*), COUNT(image_url),
+                       COUNT(DISTINCT restaurant_url), COUNT(DISTINCT category)
+                FROM products
+            ''')
+            total_products, products_with_images, total_restaurants, total_categories = cursor.fetchone()
             
             # Productos por categoría
             cursor.execute('''
@@ -372,16 +744,17 @@ def main():
             print()
         
         # Guardar en base de datos
-        scraper.save_to_database(products)
+        summary = scraper.save_to_database(products)
         
-        # Mostrar estadísticas
-        stats = scraper.get_stats_from_database()
-        print("📊 ESTADÍSTICAS:")
-        print(f"Total productos: {stats.get('total_products', 0)}")
-        print(f"Con imágenes: {stats.get('products_with_images', 0)}")
-        print(f"Sin imágenes: {stats.get('products_without_images', 0)}")
-        print(f"Restaurantes: {stats.get('total_restaurants', 0)}")
-        print(f"Categorías: {stats.get('total_categories', 0)}")
+        # Estadísticas de este scraping, ya calculadas al guardar (sin volver
+        # a recorrer la BD; get_stats_from_database da los totales globales)
+        if summary:
+            print("📊 ESTADÍSTICAS:")
+            print(f"Restaurante: {summary['name']}")
+            print(f"Total productos: {summary['total_products']}")
+            print(f"Con imágenes: {summary['products_with_images']}")
+            print(f"Sin imágenes: {summary['total_products'] - summary['products_with_images']}")
+            print(f"Categorías: {len({p.category for p in products})}")
     
     return products
 
@@ -0,0 +1,45 @@
+"""
+⚙️ Configuración de gunicorn para la API
+
+Uso:
+    gunicorn -c gunicorn_conf.py app:app            # producción
+    gunicorn -c gunicorn_conf.py api_example:app    # ejemplo
+
+Los endpoints son I/O-bound (BD, scraping, webhooks de n8n), así que por
+defecto se usan workers gevent: cada conexión es un greenlet y gunicorn
+aplica el monkey patching de gevent al arrancar cada worker.
+
+Para HTTP/2 y TLS, poner delante un proxy (nginx: ``listen 443 ssl http2``
+con ``proxy_http_version 1.1`` hacia gunicorn) y dejar que el keepalive de
+abajo mantenga abiertas las conexiones proxy → gunicorn.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# SO_REUSEPORT solo permite que otro proceso enlace el mismo puerto (p. ej.
+# un segundo gunicorn durante un despliegue). No reparte carga entre workers:
+# el master abre un único socket que todos los workers comparten.
+reuse_port = os.getenv('GUNICORN_REUSE_PORT', '0') == '1'
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+
+# Solo aplica con worker_class='gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# n8n y el frontend sondean a intervalos cortos: mantener la conexión
+# abierta entre sondeos evita un handshake TCP/TLS por llamada
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# El heartbeat de los workers escribe en un fichero temporal; en /dev/shm
+# (memoria) no se bloquea por I/O de disco, típico en contenedores
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = '-'
+errorlog = '-'
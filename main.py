@@ -1,17 +1,15 @@
 import os
 import re
 import time
-import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Tuple
 from tqdm import tqdm
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from glovo_scraper_improved import GlovoScraperImproved
 
 CHROMEDRIVER_PATH = "/opt/homebrew/bin/chromedriver"
 
@@ -22,8 +20,48 @@ logging.basicConfig(
 )
 log = logging.getLogger("glovo-scraper")
 
-def download_restaurant_images(restaurant_url: str):
-    OUTPUT_DIR   = "glovo_restaurant_images"
+# Compilados una vez: el de ficheros se aplica a cada producto
+_FOLDER_SLUG_RE = re.compile(r"[^0-9a-zA-Z_-]+")
+_FILENAME_RE = re.compile(r"[^0-9a-zA-Z]+")
+
+# Banner de cookies (Usercentrics)
+_COOKIE_ACCEPT_SELECTOR = "button[data-action-type='accept']"
+_COOKIE_FOOTER_SELECTOR = "footer[data-testid='uc-footer']"
+
+# Espera en el navegador a que un selector aparezca (o desaparezca) con un
+# MutationObserver: responde en cuanto cambia el DOM, sin el sondeo cada
+# 0,5 s de WebDriverWait
+_WAIT_FOR_SELECTOR_JS = """
+const [selector, present, timeoutMs, done] = arguments;
+const ready = () => {
+    const el = document.querySelector(selector);
+    const visible = !!el && el.getClientRects().length > 0 && !el.disabled;
+    return present ? visible : !visible;
+};
+if (ready()) { done(true); return; }
+const observer = new MutationObserver(() => {
+    if (ready()) { observer.disconnect(); clearTimeout(timer); done(true); }
+});
+const timer = setTimeout(() => { observer.disconnect(); done(false); }, timeoutMs);
+observer.observe(document, {childList: true, subtree: true, attributes: true});
+"""
+
+# [nombre, src de la imagen] de cada producto de la lista, en una sola ida y
+# vuelta con el navegador (en vez de dos find_element por tarjeta)
+_COLLECT_CARDS_JS = """
+return Array.from(document.querySelectorAll('div[data-test-id="product-row-content"]'), card => {
+    const name = card.querySelector('div.product-row__name span');
+    const img = card.querySelector('img[data-test-id="img-formats"]');
+    return [name ? name.innerText.trim() : null, img ? img.src : null];
+});
+"""
+
+def wait_for_selector(driver, selector: str, timeout: float, present: bool = True) -> bool:
+    """True si el elemento queda visible (o deja de estarlo) antes del timeout"""
+    return bool(driver.execute_async_script(_WAIT_FOR_SELECTOR_JS, selector, present, int(timeout * 1000)))
+
+def collect_images_with_selenium(restaurant_url: str, scraper: GlovoScraperImproved) -> List[Tuple[str, str]]:
+    """(nombre, url de imagen) de los productos, leídos del DOM renderizado en Chrome"""
     SCROLL_STEPS = 8
     SCROLL_PAUSE = 1.0
     WAIT_TIMEOUT = 15
@@ -34,8 +72,8 @@ def download_restaurant_images(restaurant_url: str):
     opts.add_argument("--disable-dev-shm-usage")
     opts.add_argument("--no-sandbox")
     driver  = webdriver.Chrome(service=Service(CHROMEDRIVER_PATH), options=opts)
-    wait    = WebDriverWait(driver, WAIT_TIMEOUT)
-    actions = ActionChains(driver)
+    # Margen para que el timeout de la espera en JS salte antes que el de Selenium
+    driver.set_script_timeout(WAIT_TIMEOUT + 5)
 
     try:
         log.info("🌐 Abriendo %s", restaurant_url)
@@ -45,10 +83,11 @@ def download_restaurant_images(restaurant_url: str):
         # 1. Esperar y cerrar el banner de cookies
         try:
             log.info("🍪 Esperando banner de cookies/Usercentrics")
-            btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-action-type='accept']")))
-            btn.click()
+            if not wait_for_selector(driver, _COOKIE_ACCEPT_SELECTOR, WAIT_TIMEOUT):
+                raise TimeoutError(f"{WAIT_TIMEOUT}s sin botón de aceptar")
+            driver.find_element(By.CSS_SELECTOR, _COOKIE_ACCEPT_SELECTOR).click()
             log.info("✅ Cookies aceptadas")
-            wait.until(EC.invisibility_of_element_located((By.CSS_SELECTOR, "footer[data-testid='uc-footer']")))
+            wait_for_selector(driver, _COOKIE_FOOTER_SELECTOR, WAIT_TIMEOUT, present=False)
         except Exception as e:
             log.warning("⚠️ No se encontró el banner de cookies: %s", e)
 
@@ -58,67 +97,50 @@ def download_restaurant_images(restaurant_url: str):
             driver.execute_script("window.scrollBy(0, document.body.scrollHeight);")
             time.sleep(SCROLL_PAUSE)
 
-        slug   = re.sub(r"[^0-9a-zA-Z_-]+", "_", restaurant_url.rstrip("/").split("/")[-1])
-        folder = os.path.join(OUTPUT_DIR, slug)
-        os.makedirs(folder, exist_ok=True)
-        log.info("📂 Carpeta creada: %s", folder)
-
-        cards = driver.find_elements(By.CSS_SELECTOR, 'div[data-test-id="product-row-content"]')
+        # 3. Las URLs de las imágenes ya están en el DOM de la lista: se leen
+        #    todas en una sola llamada al navegador
+        cards = driver.execute_script(_COLLECT_CARDS_JS)
         log.info("🧾 Productos encontrados: %d", len(cards))
+        return [(name, scraper._improve_image_url(src)) for name, src in cards if name and src]
 
-        for idx in tqdm(range(len(cards)), desc="📥 Descarga"):
-            try:
-                cards = driver.find_elements(By.CSS_SELECTOR, 'div[data-test-id="product-row-content"]')
-                card  = cards[idx]
-                driver.execute_script("arguments[0].scrollIntoView({block:'center'});", card)
-                time.sleep(0.3)
-
-                name_el = card.find_element(By.CSS_SELECTOR, "div.product-row__name span")
-                name = name_el.text.strip()
-                if not name:
-                    continue
-
-                actions.move_to_element(name_el).click().perform()
-                time.sleep(0.5)
-
-                # 3. Cerrar primer modal
-                try:
-                    log.info("❌ Cerrando modal intermedio")
-                    close_btn = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, "svg.close-button[data-test-id='base-modal__close']")))
-                    close_btn.find_element(By.XPATH, "..").click()
-                    wait.until(EC.invisibility_of_element_located((By.CSS_SELECTOR, "div[data-test-id='modal-window']")))
-                    log.info("✅ Modal cerrado")
-                except Exception as e:
-                    log.error("❌ Error cerrando modal intermedio: %s", e)
-                    continue
-
-                # 4. Esperar imagen del modal final
-                img = wait.until(EC.visibility_of_element_located((By.CSS_SELECTOR, "picture > img.magnifier__image")))
-                src = img.get_attribute("src")
-                if not src:
-                    continue
-
-                fname = re.sub(r"[^0-9a-zA-Z]+", "_", name).lower() + ".jpg"
-                content = requests.get(src, timeout=10).content
-                with open(os.path.join(folder, fname), "wb") as f:
-                    f.write(content)
-
-                # 5. Cerrar modal de producto final
-                try:
-                    svg2 = driver.find_element(By.CSS_SELECTOR, "svg.close-button[data-test-id='base-modal__close']")
-                    svg2.find_element(By.XPATH, "..").click()
-                    wait.until(EC.invisibility_of_element_located((By.CSS_SELECTOR, "div[data-test-id='modal-window']")))
-                except:
-                    actions.send_keys(Keys.ESCAPE).perform()
-                time.sleep(0.3)
+    finally:
+        driver.quit()
 
+def download_restaurant_images(restaurant_url: str):
+    OUTPUT_DIR   = "glovo_restaurant_images"
+    DOWNLOAD_WORKERS = 16
+
+    # Las imágenes vienen en el HTML que sirve Glovo: basta el scraper HTTP.
+    # Chrome solo se arranca si de ahí no sale ninguna
+    scraper = GlovoScraperImproved()
+    images = [(p.name, p.image_url) for p in scraper.extract_product_data(restaurant_url) if p.image_url]
+    if not images:
+        log.info("🐢 Sin imágenes en el HTML, probando con Selenium")
+        images = collect_images_with_selenium(restaurant_url, scraper)
+    log.info("🖼️ Productos con imagen: %d", len(images))
+
+    slug   = _FOLDER_SLUG_RE.sub("_", restaurant_url.rstrip("/").split("/")[-1])
+    folder = os.path.join(OUTPUT_DIR, slug)
+    os.makedirs(folder, exist_ok=True)
+    log.info("📂 Carpeta creada: %s", folder)
+
+    # Descarga concurrente de las imágenes sobre la sesión (y el pool) del scraper
+    def download(item):
+        name, src = item
+        fname = _FILENAME_RE.sub("_", name).lower() + ".jpg"
+        content = scraper.session.get(src, timeout=10).content
+        with open(os.path.join(folder, fname), "wb") as f:
+            f.write(content)
+
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        futures = {pool.submit(download, item): item[0] for item in images}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="📥 Descarga"):
+            try:
+                future.result()
             except Exception as e:
-                log.warning("⚠️ Err producto %d: %s", idx, e)
+                log.warning("⚠️ Err producto %s: %s", futures[future], e)
 
-        log.info("🎉 ¡Proceso completado! Imágenes en %s", folder)
-
-    finally:
-        driver.quit()
+    log.info("🎉 ¡Proceso completado! Imágenes en %s", folder)
 
 if __name__ == "__main__":
     download_restaurant_images("https://glovoapp.com/es/es/fuengirola/la-pizza-nostra-fuengirola/")
\ No newline at end of file
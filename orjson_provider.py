@@ -0,0 +1,28 @@
+"""
+Proveedor JSON de Flask basado en orjson
+
+Sustituye al ``json`` de la stdlib en ``jsonify`` y ``request.get_json``:
+orjson serializa en C y soporta datetime y dataclasses de forma nativa.
+
+Uso:
+    app.json = OrjsonProvider(app)
+"""
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Se mantiene el orden de inserción de los dicts (ordenar cuesta CPU)
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
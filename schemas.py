@@ -0,0 +1,63 @@
+"""
+Esquemas de validación de los bodies de la API (pydantic v2)
+
+Los handlers validan el body crudo con ``model_validate_json`` (o
+``model_validate`` si ya viene decodificado, p.ej. MessagePack) y devuelven
+422 con los detalles de ``ValidationError`` si no es válido.
+"""
+
+from typing import Literal, Optional
+
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+
+from glovo_business_logic import is_glovo_restaurant_url
+
+
+class ProcessRestaurantRequest(BaseModel):
+    """Body de /api/process-restaurant"""
+    restaurant_url: str
+    user_email: EmailStr
+
+    @field_validator('restaurant_url')
+    @classmethod
+    def _check_glovo_url(cls, value: str) -> str:
+        if not is_glovo_restaurant_url(value):
+            raise ValueError("URL de restaurante inválida")
+        return value
+
+
+class ClaimJobsRequest(BaseModel):
+    """Body de /api/n8n/claim-jobs"""
+    limit: int = Field(10, ge=1, le=500)
+    webhook_url_template: str = ''
+
+
+class StartJobRequest(BaseModel):
+    """Body de /api/n8n/start-job/<job_id>"""
+    webhook_url: str = Field(min_length=1)
+
+
+class JobCompleteRequest(BaseModel):
+    """Body del webhook /api/webhook/job-complete/<job_id>"""
+    status: Literal['completed', 'failed']
+    processed_image_url: Optional[str] = None
+    watermarked_image_url: Optional[str] = None
+
+    @model_validator(mode='after')
+    def _check_urls(self):
+        if self.status == 'completed' and not (self.processed_image_url and self.watermarked_image_url):
+            raise ValueError("URLs de imagen requeridas")
+        return self
+
+
+class PaymentRequest(BaseModel):
+    """Body de /api/payment/process"""
+    request_id: str = Field(min_length=1)
+    payment_method: str = 'card'
+    amount: float = Field(0, ge=0)
+
+
+class PaymentTokenRequest(BaseModel):
+    """Body de /api/payment/process en la API de producción (token de la pasarela)"""
+    request_id: str = Field(min_length=1)
+    payment_token: str = Field(min_length=1)
@@ -0,0 +1,173 @@
+let currentRequestId = null;
+let refreshInterval = null;
+let statusSource = null;
+
+document.getElementById('processForm').addEventListener('submit', processRestaurant);
+
+async function processRestaurant(e) {
+    e.preventDefault();
+
+    const url = document.getElementById('restaurantUrl').value;
+    const email = document.getElementById('userEmail').value;
+    const submitBtn = document.getElementById('submitBtn');
+    const result = document.getElementById('result');
+
+    // Disable form
+    submitBtn.disabled = true;
+    submitBtn.textContent = '🔄 Procesando...';
+
+    // Show loading
+    showResult('loading', '🔄 Analizando restaurante...');
+
+    try {
+        const response = await fetch('/api/process-restaurant', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ restaurant_url: url, user_email: email })
+        });
+
+        const data = await response.json();
+
+        if (data.success) {
+            currentRequestId = data.request_id;
+
+            showResult('success', `
+                <h3>✅ Solicitud Creada Exitosamente</h3>
+                <p>Analizando el restaurante en segundo plano...</p>
+                <p><strong>Request ID:</strong> ${data.request_id}</p>
+            `);
+
+            document.getElementById('statusSection').style.display = 'block';
+            startAutoRefresh();
+        } else {
+            showResult('error', `❌ Error: ${data.error}`);
+        }
+    } catch (error) {
+        showResult('error', `❌ Error de conexión: ${error.message}`);
+    } finally {
+        submitBtn.disabled = false;
+        submitBtn.textContent = '🚀 Procesar Restaurante';
+    }
+}
+
+async function checkStatus() {
+    if (!currentRequestId) return;
+
+    try {
+        const response = await fetch(`/api/request-status/${currentRequestId}`);
+        renderStatus(await response.json());
+    } catch (error) {
+        console.error('Error checking status:', error);
+    }
+}
+
+function renderStatus(data) {
+    if (data.error) {
+        stopAutoRefresh();
+        showResult('error', `❌ ${data.error}`);
+        return;
+    }
+
+    if (data.status === 'failed') {
+        stopAutoRefresh();
+        showResult('error', `❌ Error: ${data.error_message}`);
+        return;
+    }
+
+    updateProgress(data.progress_percentage);
+    updateStats(data);
+
+    if (data.progress_percentage === 100) {
+        stopAutoRefresh();
+        showDownloadButton();
+    }
+}
+
+function updateProgress(percentage) {
+    const progressFill = document.getElementById('progressFill');
+    const progressText = document.getElementById('progressText');
+
+    progressFill.style.width = percentage + '%';
+    progressText.textContent = `${percentage}% completado`;
+}
+
+function updateStats(data) {
+    const stats = document.getElementById('stats');
+    stats.innerHTML = `
+        <div class="stat-card">
+            <div class="stat-value">${data.total_images}</div>
+            <div class="stat-label">Imágenes</div>
+        </div>
+        <div class="stat-card">
+            <div class="stat-value">${data.completed_images.length}</div>
+            <div class="stat-label">Completadas</div>
+        </div>
+        <div class="stat-card">
+            <div class="stat-value">${data.job_status.pending || 0}</div>
+            <div class="stat-label">Pendientes</div>
+        </div>
+        <div class="stat-card">
+            <div class="stat-value">${data.job_status.processing || 0}</div>
+            <div class="stat-label">Procesando</div>
+        </div>
+    `;
+}
+
+function showDownloadButton() {
+    const stats = document.getElementById('stats');
+    stats.innerHTML += `
+        <div class="stat-card" style="grid-column: 1/-1;">
+            <button class="btn" onclick="downloadImages()">
+                📥 Descargar Imágenes (con marca de agua)
+            </button>
+        </div>
+    `;
+}
+
+function downloadImages() {
+    window.open(`/api/download/${currentRequestId}?type=watermarked`, '_blank');
+}
+
+function startAutoRefresh() {
+    stopAutoRefresh();
+
+    // El servidor empuja el estado cuando cambia (SSE); si el navegador no
+    // lo soporta o la conexión se cae, se vuelve a sondear cada 10 segundos
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    statusSource = new EventSource(`/api/request-status-stream/${currentRequestId}`);
+    statusSource.onmessage = (event) => renderStatus(JSON.parse(event.data));
+    statusSource.onerror = () => {
+        if (statusSource) {
+            statusSource.close();
+            statusSource = null;
+            startPolling();
+        }
+    };
+}
+
+function startPolling() {
+    checkStatus();
+    refreshInterval = setInterval(checkStatus, 10000); // cada 10 segundos
+}
+
+function stopAutoRefresh() {
+    if (statusSource) {
+        statusSource.close();
+        statusSource = null;
+    }
+    if (refreshInterval) {
+        clearInterval(refreshInterval);
+        refreshInterval = null;
+    }
+}
+
+function showResult(type, message) {
+    const result = document.getElementById('result');
+    result.className = `result ${type}`;
+    result.innerHTML = message;
+    result.style.display = 'block';
+}
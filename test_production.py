@@ -8,6 +8,7 @@ Ejecutar después del deployment para verificar que todo funciona
 import requests
 import json
 import time
+from urllib.parse import urljoin
 
 # CAMBIAR ESTA URL por tu URL de Railway
 BASE_URL = "https://TU-PROYECTO.up.railway.app"
@@ -67,17 +68,24 @@ def test_endpoints():
             timeout=30
         )
         
-        if response.status_code == 200:
+        # El scraping va en segundo plano: 202 + Location con la URL de estado
+        if response.status_code == 202:
             data = response.json()
-            if data.get('success'):
-                print("✅ API procesamiento OK")
-                print(f"   Request ID: {data.get('request_id')}")
-                print(f"   Restaurante: {data.get('restaurant_name')}")
-                print(f"   Productos: {data.get('total_products')}")
-                print(f"   Imágenes: {data.get('images_to_process')}")
-                return data.get('request_id')
-            else:
-                print(f"❌ API error: {data.get('error')}")
+            print("✅ API procesamiento OK (aceptada)")
+            print(f"   Request ID: {data.get('request_id')}")
+            
+            location = response.headers.get('Location') or f"/api/request-status/{data.get('request_id')}"
+            status_url = urljoin(BASE_URL, location)
+            for _ in range(30):
+                status = requests.get(status_url, timeout=10).json()
+                if status.get('status') not in ('queued', 'scraping'):
+                    break
+                time.sleep(2)
+            print(f"   Estado: {status.get('status')}")
+            print(f"   Imágenes: {status.get('total_images')}")
+            if status.get('error_message'):
+                print(f"   Error: {status.get('error_message')}")
+            return data.get('request_id')
         else:
             print(f"❌ API failed: {response.status_code}")
             print(f"   Response: {response.text[:200]}")